@@ -2,7 +2,7 @@
 from .auth import start, bot_password
 from .registration import email, username, password
 from .totp import send_totp_instructions, totp_confirm
-from .commands import cancel
+from .commands import cancel, invite
 
 __all__ = [
     'start',
@@ -13,4 +13,5 @@ __all__ = [
     'send_totp_instructions',
     'totp_confirm',
     'cancel',
+    'invite',
 ]
@@ -2,7 +2,9 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
+from bot.services.invites import registry as invites
 from bot.utils.config import BOT_ACCESS_PASSWORD
+from bot.utils.rate_limit import bot_password_lockout
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +14,30 @@ BOT_PASSWORD, EMAIL, USERNAME, PASSWORD, TOTP_CONFIRM = range(5)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the registration conversation."""
+    # Deep link from an invite: t.me/<bot>?start=<token> skips the bot password
+    if context.args:
+        if await invites.redeem(context.args[0]):
+            logger.info(
+                "User %s joined with an invite",
+                update.effective_user.username or update.effective_user.id
+            )
+            await update.message.reply_text(
+                "Welcome to the Media Server Registration Bot!\n\n"
+                "✅ Invite accepted!\n\n"
+                "Please send me your email address.\n\n"
+                "Use /cancel at any time to stop the registration."
+            )
+            return EMAIL
+        await update.message.reply_text("⚠️ This invite link is invalid, expired or has already been used.")
+
     if BOT_ACCESS_PASSWORD:
+        remaining = bot_password_lockout.remaining(update.effective_user.id)
+        if remaining:
+            await update.message.reply_text(
+                f"⛔ Too many incorrect passwords. Please try again in {int(remaining) + 1} seconds."
+            )
+            return ConversationHandler.END
+
         await update.message.reply_text(
             "Welcome to the Registration Bot!\n\n"
             "🔐 This bot is password-protected.\n\n"
@@ -38,21 +63,30 @@ async def bot_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     try:
         await update.message.delete()
     except Exception as e:
-        logger.warning(f"Could not delete bot password message: {e}")
+        logger.warning("Could not delete bot password message: %s", e)
 
     # Check if password matches
     if user_password == BOT_ACCESS_PASSWORD:
-        logger.info(f"User {update.effective_user.username or update.effective_user.id} authenticated successfully")
+        bot_password_lockout.reset(update.effective_user.id)
+        logger.info(
+            "User %s authenticated successfully",
+            update.effective_user.username or update.effective_user.id
+        )
         await update.message.reply_text(
             "✅ Access granted!\n\n"
             "Please send me your email address."
         )
         return EMAIL
     else:
-        logger.warning(f"Failed bot password attempt from {update.effective_user.username or update.effective_user.id}")
+        logger.warning(
+            "Failed bot password attempt from %s",
+            update.effective_user.username or update.effective_user.id
+        )
+        lockout = bot_password_lockout.record_failure(update.effective_user.id)
         await update.message.reply_text(
             "❌ Incorrect password.\n\n"
             "Access denied. Please contact the administrator if you need access.\n\n"
-            "Use /start to try again."
+            + (f"Too many attempts, please wait {int(lockout)} seconds before trying again."
+               if lockout else "Use /start to try again.")
         )
         return ConversationHandler.END
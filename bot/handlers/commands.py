@@ -1,15 +1,55 @@
-"""Command handlers (/cancel, etc)."""
+"""Command handlers (/cancel, /invite, etc)."""
 import logging
+import math
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
+from bot.services.invites import registry as invites
+from bot.utils.config import ADMIN_USER_IDS, INVITE_TTL, INVITE_MAX_TTL
+from .auth import TOTP_CONFIRM
 
 logger = logging.getLogger(__name__)
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel the registration process."""
+    # The queued job would still create the account, with no conversation left to finish it
+    if context.user_data.get('provisioning') == 'pending':
+        await update.message.reply_text(
+            "⏳ Your account is already being created and can't be cancelled now.\n\n"
+            "I'll message you as soon as it's ready."
+        )
+        return TOTP_CONFIRM
+
     context.user_data.clear()
     await update.message.reply_text(
         "❌ Registration cancelled. Use /start to begin again."
     )
     return ConversationHandler.END
+
+
+async def invite(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Mint a single-use invite link (admins only). Usage: /invite [hours]"""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        logger.warning("Non-admin %s tried to create an invite", update.effective_user.id)
+        return
+
+    ttl = INVITE_TTL
+    if context.args:
+        try:
+            ttl = float(context.args[0]) * 3600
+        except ValueError:
+            await update.message.reply_text("Usage: /invite [hours]")
+            return
+        # float() also accepts 'nan' and 'inf'
+        if not math.isfinite(ttl) or not 0 < ttl <= INVITE_MAX_TTL:
+            await update.message.reply_text(
+                f"Usage: /invite [hours], at most {INVITE_MAX_TTL / 3600:g} hours"
+            )
+            return
+
+    token = await invites.create(ttl)
+    await update.message.reply_text(
+        "🎟 Single-use invite link (valid for "
+        f"{ttl / 3600:g} hours):\n\n"
+        f"https://t.me/{context.bot.username}?start={token}"
+    )
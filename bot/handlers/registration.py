@@ -1,9 +1,13 @@
 """Registration handlers (email, username, password)."""
 import logging
 from telegram import Update
-from telegram.ext import ContextTypes, ConversationHandler
+from telegram.ext import Application, ContextTypes
 from bot.utils.validators import validate_email, validate_username, validate_password
 from bot.services.user_service import create_and_setup_user
+from bot.services.provisioning_queue import ProvisioningJob
+from bot.services import uniqueness, provisioning_queue, provisioning_state
+from bot.services.resilience import CircuitOpenError
+from bot.utils import tracing
 from .auth import EMAIL, USERNAME, PASSWORD, TOTP_CONFIRM
 
 logger = logging.getLogger(__name__)
@@ -21,6 +25,8 @@ async def email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return EMAIL
 
     context.user_data['email'] = result
+    # Check for duplicates in the background while the user picks a username
+    uniqueness.prefetch_email(result)
     await update.message.reply_text(
         f"✅ Email: {result}\n\n"
         "Now, please choose a username (letters, numbers, underscores, and hyphens only):"
@@ -39,7 +45,23 @@ async def username(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return USERNAME
 
+    # If the email check already came back, reject a duplicate right away,
+    # unless this is a retry of a signup that stopped half-way
+    if (
+        uniqueness.known_taken('email', context.user_data['email'])
+        and not await provisioning_state.is_resumable(
+            result, context.user_data['email'], update.effective_user.id
+        )
+    ):
+        await update.message.reply_text(
+            f"❌ The email '{context.user_data['email']}' is already registered.\n\n"
+            "Please enter a different email:"
+        )
+        return EMAIL
+
     context.user_data['username'] = result
+    # Check for duplicates in the background while the user picks a password
+    uniqueness.prefetch_username(result)
     await update.message.reply_text(
         f"✅ Username: {result}\n\n"
         "Finally, please choose a secure password (at least 8 characters):"
@@ -64,21 +86,124 @@ async def password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         await update.message.delete()
     except Exception as e:
-        logger.warning(f"Could not delete password message: {e}")
+        logger.warning("Could not delete password message: %s", e)
 
     # Create and setup user
     email = context.user_data['email']
     username = context.user_data['username']
     password_value = context.user_data['password']
 
-    success = await create_and_setup_user(update, context, email, username, password_value)
-
-    if success:
-        # Send TOTP enrollment instructions
-        from .totp import send_totp_instructions
-        await send_totp_instructions(update, context)
-        return TOTP_CONFIRM
-    else:
-        # Clear stored data on failure
-        context.user_data.clear()
-        return ConversationHandler.END
+    # Both lookups were started earlier, so these normally return immediately
+    try:
+        email_in_use = await uniqueness.email_taken(email)
+        username_in_use = await uniqueness.username_taken(username)
+    except CircuitOpenError as e:
+        logger.warning("Registration paused: %s", e)
+        await update.message.reply_text(
+            "⚠️ Our account service is temporarily unavailable.\n\n"
+            "Please send your password again in a few minutes."
+        )
+        return PASSWORD
+
+    # A retry of this user's signup that stopped half-way finds its own
+    # account; the job resumes it instead
+    if await provisioning_state.is_resumable(username, email, update.effective_user.id):
+        email_in_use = username_in_use = False
+
+    if email_in_use:
+        await update.message.reply_text(
+            f"❌ The email '{email}' is already registered.\n\n"
+            "Please enter a different email:"
+        )
+        return EMAIL
+
+    if username_in_use:
+        await update.message.reply_text(
+            f"❌ The username '{username}' is already taken.\n\n"
+            "Please choose a different username:"
+        )
+        return USERNAME
+
+    # Create the account in the background and answer right away; the worker
+    # messages this chat when the account is ready
+    context.user_data['provisioning'] = 'pending'
+    await provisioning_queue.enqueue(ProvisioningJob(
+        chat_id=update.effective_chat.id,
+        user_id=update.effective_user.id,
+        email=email,
+        username=username,
+        password=password_value,
+        trace_id=context.user_data.get('trace_id', '')
+    ))
+    await update.message.reply_text(
+        "⏳ Creating your account...\n\n"
+        "I'll message you here as soon as it's ready."
+    )
+    return TOTP_CONFIRM
+
+
+async def run_provisioning_job(application: Application, job: ProvisioningJob) -> None:
+    """Create the account for a queued job and continue the conversation in its chat."""
+    root = None
+    try:
+        with tracing.span(
+            'provisioning',
+            trace_id=job.trace_id or tracing.new_trace_id(),
+            job_id=job.job_id,
+            attempt=job.attempts
+        ) as root:
+            await _run_job(application, job)
+    finally:
+        if root is not None:
+            tracing.log_if_slow(root)
+
+
+async def _run_job(application: Application, job: ProvisioningJob) -> None:
+    user_data = application.user_data[job.user_id]
+
+    success = await create_and_setup_user(
+        application.bot, job.chat_id, job.user_id, job.email, job.username, job.password, job.job_id
+    )
+
+    # user_data changed outside a handler; make sure it gets persisted
+    application.mark_data_for_update_persistence(user_ids=job.user_id)
+
+    if not success:
+        _mark_failed(user_data)
+        return
+
+    # Store user data for next steps
+    user_data['username'] = job.username
+    user_data['password'] = job.password
+    user_data['email'] = job.email
+    user_data['provisioning'] = 'done'
+
+    # Send TOTP enrollment instructions. The account already exists, so a
+    # failure here must not make the job retry.
+    from .totp import send_totp_instructions
+    try:
+        await send_totp_instructions(application.bot, job.chat_id, job.username, job.password)
+    except Exception as e:
+        logger.error("Error sending TOTP instructions to %s: %s", job.username, e, exc_info=True)
+
+
+def _mark_failed(user_data: dict) -> None:
+    # Drop the signup details but keep the conversation state, so the user's
+    # next message reaches totp_confirm and ends the conversation
+    for key in ('email', 'username', 'password'):
+        user_data.pop(key, None)
+    user_data['provisioning'] = 'failed'
+
+
+async def provisioning_failed(application: Application, job: ProvisioningJob, error: Exception) -> None:
+    """Tell the user their queued registration could not be completed."""
+    _mark_failed(application.user_data[job.user_id])
+    # Nothing will resume this account any more
+    if await provisioning_state.is_resumable(job.username, job.email, job.user_id):
+        await provisioning_state.clear(job.username)
+    application.mark_data_for_update_persistence(user_ids=job.user_id)
+    await application.bot.send_message(
+        job.chat_id,
+        "❌ Failed to create user.\n\n"
+        "Please try again with /start or contact an administrator."
+    )
@@ -1,35 +1,34 @@
 """TOTP handlers (setup and confirmation)."""
 import logging
 import io
-from telegram import Update
+from telegram import Bot, Update
 from telegram.ext import ContextTypes, ConversationHandler
-from bot.utils.config import AUTHENTIK_URL, JELLYFIN_URL
+from bot.utils.config import AUTHENTIK_URL, JELLYFIN_URL, COALESCE_STATUS_MESSAGES
+from bot.utils.messaging import StatusMessage
 from bot.services.authentik_api import enroll_totp
 from .auth import TOTP_CONFIRM
 
 logger = logging.getLogger(__name__)
 
 
-async def send_totp_instructions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def send_totp_instructions(bot: Bot, chat_id: int, username: str, password: str):
     """Send TOTP setup instructions with QR code and wait for confirmation."""
-    username = context.user_data.get('username')
-    password = context.user_data.get('password')
-
-    # Send initial message
-    await update.message.reply_text(
+    # Send initial message; it is replaced by the instructions when coalescing
+    status = StatusMessage(bot, chat_id)
+    await status.update(
         "🔐 **Setting up Two-Factor Authentication (2FA)**\n\n"
         "Please wait while I generate your TOTP enrollment...",
         parse_mode='Markdown'
     )
 
     # Enroll TOTP and get QR code
-    logger.info(f"Enrolling TOTP for user {username}...")
+    logger.info("Enrolling TOTP for user %s...", username)
     totp_data = await enroll_totp(username, password)
 
     if not totp_data or not totp_data.get('qr_code'):
         # Fallback to manual setup if QR generation fails
         logger.warning("QR code generation failed, falling back to manual setup")
-        await update.message.reply_text(
+        await status.update(
             "⚠️ Automated setup failed. Please set up TOTP manually:\n\n"
             f"1. Log in to {AUTHENTIK_URL}\n"
             f"2. Go to {AUTHENTIK_URL}/if/flow/default-authenticator-totp-setup/\n"
@@ -69,16 +68,9 @@ Then type 'done' below when you've completed the verification.
 **Important:** Keep your authenticator app safe - you'll need it for every login!
 """
 
-    await update.message.reply_text(totp_instructions, parse_mode='Markdown')
+    await status.update(totp_instructions, parse_mode='Markdown')
 
-    # Send QR code as photo
-    await update.message.reply_photo(
-        photo=io.BytesIO(qr_code_bytes),
-        caption="📱 Scan this QR code with your authenticator app"
-    )
-
-    # Send manual entry option as fallback
-    # Extract secret from config_url for manual entry
+    # Manual entry option as fallback
     manual_entry_text = f"""
 **Alternative: Manual Entry**
 If you can't scan the QR code, you can manually enter these details in your authenticator app:
@@ -90,7 +82,18 @@ Type: Time-based
 After setup, please type 'done' to continue.
 """
 
-    await update.message.reply_text(manual_entry_text, parse_mode='Markdown')
+    # Send QR code as photo; when coalescing, the manual entry text rides
+    # along as its caption instead of being a separate message
+    caption = "📱 Scan this QR code with your authenticator app"
+    await bot.send_photo(
+        chat_id,
+        photo=io.BytesIO(qr_code_bytes),
+        caption=caption + "\n" + manual_entry_text if COALESCE_STATUS_MESSAGES else caption,
+        parse_mode='Markdown' if COALESCE_STATUS_MESSAGES else None
+    )
+
+    if not COALESCE_STATUS_MESSAGES:
+        await bot.send_message(chat_id, manual_entry_text, parse_mode='Markdown')
 
 
 async def send_jellyfin_instructions(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -142,6 +145,21 @@ async def totp_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     """Handle TOTP confirmation from user."""
     user_response = update.message.text.strip().lower()
 
+    # The account is still being created in the background
+    if context.user_data.get('provisioning') == 'pending':
+        await update.message.reply_text(
+            "⏳ Your account is still being set up. I'll message you as soon as it's ready."
+        )
+        return TOTP_CONFIRM
+
+    if context.user_data.get('provisioning') == 'failed':
+        context.user_data.clear()
+        await update.message.reply_text(
+            "❌ Your registration could not be completed.\n\n"
+            "Please try again with /start or contact an administrator."
+        )
+        return ConversationHandler.END
+
     if user_response == 'done':
         await update.message.reply_text("✅ Great! Let me send you the Jellyfin access instructions...")
 
@@ -1,46 +1,187 @@
 """Main bot application."""
+import asyncio
+import functools
 import logging
+import signal
 from telegram import Update
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     MessageHandler,
+    TypeHandler,
     ConversationHandler,
     filters,
 )
-from bot.utils.config import TELEGRAM_BOT_TOKEN, validate_config
+import uvicorn
+from bot.utils.config import (
+    TELEGRAM_BOT_TOKEN,
+    BOT_MODE,
+    POLL_INTERVAL,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    MAX_CONCURRENT_UPDATES,
+    METRICS_PORT,
+    PERSISTENCE_DB,
+    PERSISTENCE_FLUSH_INTERVAL,
+    TELEGRAM_MAX_RATE,
+    TELEGRAM_MAX_RETRIES,
+    JELLYFIN_GROUP,
+    USER_INDEX_ENABLED,
+    validate_config,
+)
 from bot.handlers.auth import start, bot_password, BOT_PASSWORD, EMAIL, USERNAME, PASSWORD
-from bot.handlers.registration import email, username, password
+from bot.handlers.registration import (
+    email,
+    username,
+    password,
+    run_provisioning_job,
+    provisioning_failed,
+)
 from bot.handlers.totp import totp_confirm
-from bot.handlers.commands import cancel
+from bot.handlers.commands import cancel, invite
 from bot.handlers.auth import TOTP_CONFIRM
+from bot.services import authentik_api, cloudflare_access, provisioning_queue, invites
+from bot.server import BackgroundServer, create_asgi_app, serve_metrics
+from bot.utils.update_processor import PerChatUpdateProcessor
+from bot.utils.persistence import SQLitePersistence
+from bot.utils import sessions, tracing
+from bot.utils.sessions import tracked
+from bot.utils.rate_limit import enforce_rate_limit
+from bot.utils.telegram_request import MeteredRequest
 
 logger = logging.getLogger(__name__)
 
+# Long-running service tasks started in post_init and cancelled on shutdown
+_background_tasks: list[asyncio.Task] = []
+
+
+async def post_init(application: Application) -> None:
+    """Open long-lived service clients once the application starts."""
+    authentik_api.init_client()
+    cloudflare_access.init_client()
+    await provisioning_queue.start(
+        functools.partial(run_provisioning_job, application),
+        functools.partial(provisioning_failed, application)
+    )
+    _background_tasks.append(
+        asyncio.create_task(authentik_api.refresh_group_cache([JELLYFIN_GROUP]))
+    )
+    _background_tasks.append(asyncio.create_task(sessions.sweep_periodically(application)))
+    _background_tasks.append(asyncio.create_task(tracing.export_periodically()))
+    await invites.registry.load()
+    _background_tasks.append(asyncio.create_task(invites.sweep_periodically()))
+    if BOT_MODE != 'webhook' and METRICS_PORT:
+        _background_tasks.append(asyncio.create_task(serve_metrics(application)))
+    if USER_INDEX_ENABLED:
+        _background_tasks.append(
+            asyncio.create_task(authentik_api.sync_user_index_periodically())
+        )
+
+
+async def post_stop(application: Application) -> None:
+    """Stop the provisioning workers before shutdown saves user_data for the last time."""
+    await provisioning_queue.stop()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Close service clients when the application stops."""
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await authentik_api.close_client()
+    await cloudflare_access.close_client()
+    await tracing.shutdown()
+
 
 def create_app() -> Application:
     """Create and configure the bot application."""
     # Create application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        # Counts Bot API calls for /metrics; pool size matches the builder's default
+        .request(MeteredRequest(connection_pool_size=256))
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        # Queue outbound calls within Telegram's flood limits and retry on RetryAfter
+        .rate_limiter(AIORateLimiter(
+            overall_max_rate=TELEGRAM_MAX_RATE,
+            max_retries=TELEGRAM_MAX_RETRIES
+        ))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if PERSISTENCE_DB:
+        builder.persistence(SQLitePersistence(PERSISTENCE_DB, update_interval=PERSISTENCE_FLUSH_INTERVAL))
+    application = builder.build()
 
     # Conversation handler
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
+        entry_points=[CommandHandler('start', tracked(start, entry=True))],
         states={
-            BOT_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot_password)],
-            EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, email)],
-            USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, username)],
-            PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, password)],
-            TOTP_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, totp_confirm)],
+            BOT_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, tracked(bot_password))],
+            EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, tracked(email))],
+            USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, tracked(username))],
+            PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, tracked(password))],
+            TOTP_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, tracked(totp_confirm))],
         },
-        fallbacks=[CommandHandler('cancel', cancel)],
+        fallbacks=[CommandHandler('cancel', tracked(cancel, entry=True))],
+        name='registration',
+        persistent=bool(PERSISTENCE_DB),
     )
 
+    # Flood control runs before every other handler
+    application.add_handler(TypeHandler(Update, enforce_rate_limit), group=-1)
     application.add_handler(conv_handler)
+    application.add_handler(CommandHandler('invite', invite))
 
     return application
 
 
+async def run_webhook(application: Application) -> None:
+    """Serve updates pushed by Telegram from the built-in ASGI server."""
+    server = BackgroundServer(uvicorn.Config(
+        create_asgi_app(application),
+        host=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        lifespan='off',
+        # Keep uvicorn's own handlers off, so its logs go through the root queue handler
+        log_config=None,
+        log_level='warning'
+    ))
+
+    # run_webhook/run_polling normally drive this lifecycle and the hooks
+    await application.initialize()
+    await post_init(application)
+    # Our own handlers, so a SIGTERM ends serve() and the cleanup below still runs
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, setattr, server, 'should_exit', True)
+    try:
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY]
+        )
+        await application.start()
+        logger.info("Bot started (webhook on %s:%s%s)...", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        await server.serve()
+    finally:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+        # Before shutdown flushes persistence, so no finished job's user_data is lost
+        await post_stop(application)
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await post_shutdown(application)
+
+
 def run():
     """Run the bot."""
     # Validate configuration
@@ -50,14 +191,18 @@ def run():
     # Create application
     application = create_app()
 
-    # Start the bot with optimized polling
+    if BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(application))
+        return
+
+    # Start the bot with long polling
     logger.info("Bot started...")
     # Polling parameters:
-    # - poll_interval: seconds between polling requests (default 0, meaning continuous)
+    # - poll_interval: extra seconds between polling requests (default 0, meaning continuous)
     # - timeout: how long to wait for updates (long polling, reduces requests)
     # - allowed_updates: only listen for message and command updates (not all update types)
     application.run_polling(
-        poll_interval=1.0,  # Wait 1 second between polls
+        poll_interval=POLL_INTERVAL,
         timeout=30,  # Long polling timeout (server holds connection for 30 seconds)
         allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY]
     )
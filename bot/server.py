@@ -0,0 +1,128 @@
+"""Built-in ASGI server for webhook updates, health checks and metrics."""
+import contextlib
+import hmac
+import json
+import logging
+from telegram import Update
+from telegram.ext import Application
+import uvicorn
+from bot.utils import metrics
+from bot.utils.config import WEBHOOK_PATH, WEBHOOK_SECRET, METRICS_LISTEN, METRICS_PORT
+from bot.utils.sessions import live_conversations
+
+logger = logging.getLogger(__name__)
+
+# Telegram updates are small; anything larger is not from Telegram
+MAX_BODY_SIZE = 1024 * 1024
+
+
+async def _read_body(receive) -> bytes | None:
+    """Read the request body, or return None if it exceeds MAX_BODY_SIZE."""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_SIZE:
+            return None
+        if not message.get('more_body'):
+            return body
+
+
+async def _respond(send, status: int, body: bytes = b'', content_type: str = 'text/plain; charset=utf-8') -> None:
+    """Send a complete HTTP response."""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode()),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(application: Application, webhook: bool = True):
+    """
+    Create the ASGI app serving:
+      POST WEBHOOK_PATH  Telegram updates (secret token verified, webhook only)
+      GET  /healthz      liveness check
+      GET  /metrics      Prometheus-style metrics
+    """
+
+    async def handle_update(scope, receive, send) -> None:
+        headers = dict(scope['headers'])
+        token = headers.get(b'x-telegram-bot-api-secret-token', b'')
+        if not hmac.compare_digest(token, (WEBHOOK_SECRET or '').encode()):
+            logger.warning("Rejected webhook request with an invalid secret token")
+            await _respond(send, 403, b'forbidden')
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            await _respond(send, 413, b'payload too large')
+            return
+
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except Exception as e:
+            logger.warning("Rejected malformed webhook update: %s", e)
+            await _respond(send, 400, b'bad request')
+            return
+
+        # Hand the update to the application and acknowledge Telegram at once
+        await application.update_queue.put(update)
+        await _respond(send, 200, b'ok')
+
+    async def handle_health(scope, receive, send) -> None:
+        await _respond(send, 200, b'ok')
+
+    async def handle_metrics(scope, receive, send) -> None:
+        body = (
+            "# TYPE bot_update_queue_size gauge\n"
+            f"bot_update_queue_size {application.update_queue.qsize()}\n"
+            "# TYPE bot_live_conversations gauge\n"
+            f"bot_live_conversations {live_conversations(application)}\n"
+            + metrics.render()
+        ).encode()
+        await _respond(send, 200, body, 'text/plain; version=0.0.4; charset=utf-8')
+
+    routes = {
+        ('GET', '/healthz'): handle_health,
+        ('GET', '/metrics'): handle_metrics,
+    }
+    if webhook:
+        routes[('POST', WEBHOOK_PATH)] = handle_update
+
+    async def app(scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            return
+        handler = routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await _respond(send, 404, b'not found')
+            return
+        await handler(scope, receive, send)
+
+    return app
+
+
+class BackgroundServer(uvicorn.Server):
+    """uvicorn server that leaves signal handling to the bot."""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def serve_metrics(application: Application) -> None:
+    """Serve /healthz and /metrics on METRICS_LISTEN:METRICS_PORT (polling mode)."""
+    server = BackgroundServer(uvicorn.Config(
+        create_asgi_app(application, webhook=False),
+        host=METRICS_LISTEN,
+        port=METRICS_PORT,
+        lifespan='off',
+        # Keep uvicorn's own handlers off, so its logs go through the root queue handler
+        log_config=None,
+        log_level='warning'
+    ))
+    logger.info("Metrics available on %s:%s/metrics", METRICS_LISTEN, METRICS_PORT)
+    await server.serve()
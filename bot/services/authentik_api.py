@@ -1,16 +1,61 @@
 """Authentik API service module."""
 
+import asyncio
+import functools
 import logging
-import io
-import qrcode
-import requests
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import urllib3
 import authentik_client
 from authentik_client.rest import ApiException
 from authentik_client.models import UserRequest, UserPasswordSetRequest, UserAccountRequest
-from bot.utils.config import AUTHENTIK_URL, AUTHENTIK_API_TOKEN
+from bot.services import resilience
+from bot.services.qr_code import render_qr_code
+from bot.services.resilience import CircuitOpenError
+from bot.utils import metrics, tracing
+from bot.utils.config import (
+    AUTHENTIK_URL,
+    AUTHENTIK_API_TOKEN,
+    AUTHENTIK_TIMEOUT,
+    AUTHENTIK_MAX_CONCURRENCY,
+    AUTHENTIK_MAX_RETRIES,
+    AUTHENTIK_POOL_SIZE,
+    GROUP_CACHE_TTL,
+    JELLYFIN_GROUP,
+    USER_INDEX_ENABLED,
+    USER_INDEX_SYNC_INTERVAL,
+    USER_INDEX_PAGE_SIZE,
+    FLOW_MAX_STAGES,
+)
 
 logger = logging.getLogger(__name__)
 
+# authentik_client is synchronous; its calls run on this bounded pool so a slow
+# Authentik response never blocks the event loop. The pool size caps concurrency.
+_executor = ThreadPoolExecutor(
+    max_workers=AUTHENTIK_MAX_CONCURRENCY,
+    thread_name_prefix="authentik"
+)
+# One slot per pool thread. A call takes a slot before it is submitted, so its
+# timeout covers only the request itself, never time spent queued for a thread.
+_slots = asyncio.Semaphore(AUTHENTIK_MAX_CONCURRENCY)
+
+
+# Long-lived clients shared by every call; see init_client()/close_client().
+# authentik_client pools through urllib3, the flow executor through httpx.
+_api_client: authentik_client.ApiClient | None = None
+_flow_transport: httpx.AsyncHTTPTransport | None = None
+
+# Group name (lowercased) -> (group pk, expiry on the monotonic clock)
+_group_cache: dict[str, tuple[str, float]] = {}
+
+# Optional local index of known (lowercased) emails and usernames, synced
+# periodically from Authentik so obvious duplicates skip the round trip
+_known_emails: set[str] = set()
+_known_usernames: set[str] = set()
+
 
 def _get_configuration() -> authentik_client.Configuration:
     """Create and return Authentik API configuration."""
@@ -18,221 +63,465 @@ def _get_configuration() -> authentik_client.Configuration:
         host=f"{AUTHENTIK_URL}/api/v3",
         access_token=AUTHENTIK_API_TOKEN
     )
+    # Keep up to AUTHENTIK_POOL_SIZE connections open to Authentik and let the
+    # OS keep idle ones alive, so signups reuse connections instead of redoing
+    # the TCP + TLS handshake on every call.
+    configuration.connection_pool_maxsize = AUTHENTIK_POOL_SIZE
+    configuration.socket_options = urllib3.connection.HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
     return configuration
 
 
-async def check_email_exists(email: str) -> bool:
-    """Check if an email is already registered in Authentik."""
-    try:
-        configuration = _get_configuration()
+def init_client() -> None:
+    """Create the shared Authentik API clients (called once at startup)."""
+    global _api_client, _flow_transport
+    if _api_client is None:
+        _api_client = authentik_client.ApiClient(_get_configuration())
+        logger.info("Authentik API client ready (pool size %s)", AUTHENTIK_POOL_SIZE)
+    if _flow_transport is None:
+        _flow_transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=AUTHENTIK_POOL_SIZE,
+                max_keepalive_connections=AUTHENTIK_POOL_SIZE
+            )
+        )
 
-        with authentik_client.ApiClient(configuration) as api_client:
-            api = authentik_client.CoreApi(api_client)
 
-            # Search for users with the email
-            users_response = api.core_users_list(search=email)
+async def close_client() -> None:
+    """Close the shared Authentik API clients and their connection pools."""
+    global _api_client, _flow_transport
+    if _api_client is not None:
+        _api_client.rest_client.pool_manager.clear()
+        _api_client = None
+        logger.info("Authentik API client closed")
+    if _flow_transport is not None:
+        await _flow_transport.aclose()
+        _flow_transport = None
 
-            # Check if any user has an exact email match
-            for user in users_response.results:
-                if user.email and user.email.lower() == email.lower():
-                    logger.info(
-                        f"Email {email} already exists for user {user.username}"
-                    )
-                    return True
 
-            return False
+def _get_api() -> authentik_client.CoreApi:
+    """Return a CoreApi bound to the shared client, creating it if needed."""
+    if _api_client is None:
+        init_client()
+    return authentik_client.CoreApi(_api_client)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Return True for errors worth retrying: timeouts, connection errors, 429 and 5xx."""
+    if isinstance(error, ApiException):
+        return not error.status or error.status == 429 or error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, urllib3.exceptions.HTTPError))
+
+
+async def _call(func, *args, idempotent: bool = True, **kwargs):
+    """
+    Run a blocking authentik_client call in the worker pool with a timeout,
+    through the Authentik circuit breaker. Idempotent calls are retried on
+    transient errors.
+    """
+    kwargs.setdefault('_request_timeout', AUTHENTIK_TIMEOUT)
+    loop = asyncio.get_running_loop()
+
+    async def attempt():
+        # Propagate the trace of the current attempt to Authentik
+        call = functools.partial(func, *args, _headers=tracing.headers() or None, **kwargs)
+        await _slots.acquire()
+        try:
+            future = _executor.submit(call)
+        except BaseException:
+            _slots.release()
+            raise
+        # The slot is freed when the thread is, so a call that timed out
+        # keeps it until the request actually returns
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(_slots.release))
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=AUTHENTIK_TIMEOUT)
+
+    return await resilience.call(
+        resilience.authentik_breaker,
+        attempt,
+        retries=AUTHENTIK_MAX_RETRIES if idempotent else 0,
+        is_transient=_is_transient
+    )
+
+
+async def list_users(page_size: int = 100, **filters):
+    """Yield every user matching the filters, following all result pages."""
+    api = _get_api()
+    page = 1
+    while True:
+        users_response = await _call(
+            api.core_users_list,
+            page=page,
+            page_size=page_size,
+            include_groups=False,
+            **filters
+        )
+        for user in users_response.results:
+            yield user
+        if not users_response.pagination.next:
+            return
+        page = int(users_response.pagination.next)
+
+
+@metrics.timed('authentik.fetch_user_identities')
+async def fetch_user_identities() -> tuple[set[str], set[str]]:
+    """Return the (lowercased) emails and usernames of every Authentik user."""
+    emails = set()
+    usernames = set()
+    async for user in list_users(page_size=USER_INDEX_PAGE_SIZE):
+        if user.email:
+            emails.add(user.email.lower())
+        usernames.add(user.username.lower())
+    return emails, usernames
+
+
+@metrics.timed('authentik.sync_user_index')
+async def sync_user_index() -> None:
+    """Rebuild the local index of known emails and usernames from Authentik."""
+    global _known_emails, _known_usernames
+    emails, usernames = await fetch_user_identities()
+    _known_emails, _known_usernames = emails, usernames
+    logger.info("User index synced: %s emails, %s usernames", len(emails), len(usernames))
+
+
+async def sync_user_index_periodically() -> None:
+    """Keep the local user index in sync with Authentik."""
+    while True:
+        try:
+            await sync_user_index()
+        except Exception as e:
+            logger.warning("User index sync failed: %s", e)
+        await asyncio.sleep(USER_INDEX_SYNC_INTERVAL)
+
+
+def _index_user(username: str, email: str) -> None:
+    """Record a newly created user in the local index."""
+    if USER_INDEX_ENABLED:
+        _known_emails.add(email.lower())
+        _known_usernames.add(username.lower())
+
+
+@metrics.timed('authentik.check_email_exists')
+async def check_email_exists(email: str) -> bool:
+    """Check if an email is already registered in Authentik."""
+    # The local index only proves presence; a miss still asks Authentik
+    if USER_INDEX_ENABLED and email.lower() in _known_emails:
+        logger.info("Email %s already exists (local index)", email)
+        return True
+
+    try:
+        # Exact-match filter, checking every page of results
+        async for user in list_users(email=email):
+            if user.email and user.email.lower() == email.lower():
+                logger.info("Email %s already exists for user %s", email, user.username)
+                return True
 
+        return False
+
+    except CircuitOpenError:
+        raise
+    except asyncio.TimeoutError:
+        logger.error("Timed out checking email existence for %s", email)
+        return False
     except ApiException as e:
-        logger.error(f"API exception checking email existence: {e}")
+        logger.error("API exception checking email existence: %s", e)
         return False
     except Exception as e:
-        logger.error(f"Error checking email existence: {e}")
+        logger.error("Error checking email existence: %s", e)
         return False
 
 
-async def create_user(username: str, email: str, password: str) -> dict | None:
-    """Create user in Authentik. Returns user data with pk or None on failure."""
+@metrics.timed('authentik.check_username_exists')
+async def check_username_exists(username: str) -> bool:
+    """Check if a username is already taken in Authentik."""
+    if USER_INDEX_ENABLED and username.lower() in _known_usernames:
+        logger.info("Username %s already exists (local index)", username)
+        return True
+
     try:
-        configuration = _get_configuration()
+        async for user in list_users(username=username):
+            if user.username.lower() == username.lower():
+                logger.info("Username %s already exists", username)
+                return True
 
-        with authentik_client.ApiClient(configuration) as api_client:
-            api = authentik_client.CoreApi(api_client)
+        return False
 
-            # Step 1: Create user (without password)
-            user_request = UserRequest(
-                username=username,
-                email=email,
-                name=username,
-                is_active=True
-            )
+    except CircuitOpenError:
+        raise
+    except asyncio.TimeoutError:
+        logger.error("Timed out checking username existence for %s", username)
+        return False
+    except ApiException as e:
+        logger.error("API exception checking username existence: %s", e)
+        return False
+    except Exception as e:
+        logger.error("Error checking username existence: %s", e)
+        return False
 
-            logger.info(f"Creating user: {username}")
-            user = api.core_users_create(user_request)
 
-            user_pk = user.pk
-            logger.info(f"User created successfully: {user_pk}")
+@metrics.timed('authentik.find_user')
+async def find_user(username: str):
+    """Return the Authentik user with exactly this username, or None."""
+    async for user in list_users(username=username):
+        if user.username.lower() == username.lower():
+            return user
+    return None
 
-            # Step 2: Set the password
-            password_request = UserPasswordSetRequest(password=password)
-            api.core_users_set_password_create(user_pk, password_request)
 
-            logger.info(f"Password set for user: {user_pk}")
+@metrics.timed('authentik.create_user')
+async def create_user(username: str, email: str) -> int | None:
+    """Create a user in Authentik (without a password). Returns its pk or None."""
+    try:
+        api = _get_api()
+        user_request = UserRequest(
+            username=username,
+            email=email,
+            name=username,
+            is_active=True
+        )
 
-            # Return user data as dict with pk included
-            user_dict = user.to_dict() if hasattr(user, 'to_dict') else {}
-            user_dict['pk'] = user_pk
-            return user_dict
+        logger.info("Creating user: %s", username)
+        user = await _call(api.core_users_create, user_request, idempotent=False)
 
+        logger.info("User created successfully: %s", user.pk)
+        _index_user(username, email)
+        return user.pk
+
+    except CircuitOpenError:
+        raise
+    except asyncio.TimeoutError:
+        logger.error("Timed out creating user %s", username)
+        return None
     except ApiException as e:
-        logger.error(f"API exception creating user: {e}", exc_info=True)
+        logger.error("API exception creating user: %s", e, exc_info=True)
         return None
     except Exception as e:
-        logger.error(f"Error creating user: {str(e)}", exc_info=True)
+        logger.error("Error creating user: %s", e, exc_info=True)
         return None
 
 
-async def add_user_to_group(user_pk: int, group_name: str = "Jellyfin Users") -> bool:
-    """Add user to a group in Authentik."""
+@metrics.timed('authentik.set_user_password')
+async def set_user_password(user_pk: int, password: str) -> bool:
+    """Set a user's password. Safe to repeat."""
     try:
-        configuration = _get_configuration()
+        api = _get_api()
+        password_request = UserPasswordSetRequest(password=password)
+        await _call(api.core_users_set_password_create, user_pk, password_request)
+        logger.info("Password set for user: %s", user_pk)
+        return True
+
+    except CircuitOpenError:
+        raise
+    except asyncio.TimeoutError:
+        logger.error("Timed out setting password for user %s", user_pk)
+        return False
+    except ApiException as e:
+        logger.error("API exception setting password: %s", e, exc_info=True)
+        return False
+    except Exception as e:
+        logger.error("Error setting password: %s", e, exc_info=True)
+        return False
 
-        with authentik_client.ApiClient(configuration) as api_client:
-            api = authentik_client.CoreApi(api_client)
 
-            # Step 1: Get the group by name
-            logger.info(f"Looking up group '{group_name}'...")
-            groups_response = api.core_groups_list(search=group_name)
+async def _lookup_group_pk(group_name: str) -> str | None:
+    """Resolve a group name to its pk without fetching the member list."""
+    api = _get_api()
+    groups_response = await _call(
+        api.core_groups_list,
+        name=group_name,
+        include_users=False,
+        include_children=False
+    )
+    for g in groups_response.results:
+        if g.name.lower() == group_name.lower():
+            return g.pk
+    return None
+
+
+@metrics.timed('authentik.get_group_pk')
+async def get_group_pk(group_name: str, refresh: bool = False) -> str | None:
+    """Return the pk for a group name, served from the TTL cache when possible."""
+    key = group_name.lower()
+    cached = _group_cache.get(key)
+    if cached and not refresh and cached[1] > time.monotonic():
+        return cached[0]
+
+    logger.info("Looking up group '%s'...", group_name)
+    group_pk = await _lookup_group_pk(group_name)
+    if group_pk is None:
+        _group_cache.pop(key, None)
+        return None
 
-            # Find group with exact name match
-            group = None
-            for g in groups_response.results:
-                if g.name.lower() == group_name.lower():
-                    group = g
-                    break
+    _group_cache[key] = (group_pk, time.monotonic() + GROUP_CACHE_TTL)
+    logger.info("Found group '%s' with pk=%s", group_name, group_pk)
+    return group_pk
 
-            if not group:
-                logger.warning(f"Group '{group_name}' not found in Authentik")
-                return False
 
-            group_pk = group.pk
-            logger.info(f"Found group '{group_name}' with pk={group_pk}")
+async def refresh_group_cache(group_names: list[str]) -> None:
+    """Warm the group cache at startup and keep it fresh in the background."""
+    while True:
+        for group_name in group_names:
+            try:
+                await get_group_pk(group_name, refresh=True)
+            except Exception as e:
+                logger.warning("Could not refresh group '%s': %s", group_name, e)
+        # Refresh well before entries expire so lookups never hit Authentik
+        await asyncio.sleep(GROUP_CACHE_TTL / 2)
 
-            # Step 2: Check if user is already in group
-            current_users = group.users or []
-            logger.info(f"Current users in group: {current_users}")
 
-            if user_pk in current_users:
-                logger.info(f"User {user_pk} is already in group '{group_name}'")
-                return True
+@metrics.timed('authentik.add_user_to_group')
+async def add_user_to_group(user_pk: int, group_name: str = JELLYFIN_GROUP) -> bool:
+    """Add user to a group in Authentik."""
+    try:
+        api = _get_api()
 
-            # Step 3: Add user to group
-            logger.info(f"Adding user {user_pk} to group '{group_name}'...")
-            user_account_request = UserAccountRequest(pk=user_pk)
-            api.core_groups_add_user_create(group_pk, user_account_request)
+        # Step 1: Resolve the group pk (cached)
+        group_pk = await get_group_pk(group_name)
+        if not group_pk:
+            logger.warning("Group '%s' not found in Authentik", group_name)
+            return False
 
-            logger.info(f"Successfully added user {user_pk} to group '{group_name}'")
-            return True
+        # Step 2: Add user to group. Adding is idempotent in Authentik, so the
+        # group's member list is never downloaded just to check membership.
+        logger.info("Adding user %s to group '%s'...", user_pk, group_name)
+        user_account_request = UserAccountRequest(pk=user_pk)
+        try:
+            await _call(api.core_groups_add_user_create, group_pk, user_account_request)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            # The cached pk is stale (group recreated); resolve it again once
+            group_pk = await get_group_pk(group_name, refresh=True)
+            if not group_pk:
+                logger.warning("Group '%s' not found in Authentik", group_name)
+                return False
+            await _call(api.core_groups_add_user_create, group_pk, user_account_request)
 
+        logger.info("Successfully added user %s to group '%s'", user_pk, group_name)
+        return True
+
+    except CircuitOpenError:
+        raise
+    except asyncio.TimeoutError:
+        logger.error("Timed out adding user %s to group '%s'", user_pk, group_name)
+        return False
     except ApiException as e:
-        logger.error(f"API exception adding user to group: {e}", exc_info=True)
+        logger.error("API exception adding user to group: %s", e, exc_info=True)
         return False
     except Exception as e:
-        logger.error(f"Error adding user to group: {str(e)}", exc_info=True)
+        logger.error("Error adding user to group: %s", e, exc_info=True)
         return False
 
 
-async def enroll_totp(username: str, password: str) -> dict | None:
-    """
-    Enroll TOTP for a user by executing the enrollment flow.
-    Returns dict with 'config_url' and 'qr_code' (bytes) or None on failure.
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """Borrow the shared connection pool without closing it with a per-flow client."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+
+def _stage_response(challenge: dict, username: str, password: str) -> dict | None:
+    """Build the answer to a flow challenge, or None if the stage is unsupported."""
+    component = challenge.get('component', '')
+
+    if component == 'ak-stage-identification':
+        return {'component': component, 'uid_field': username, 'password': password}
+    if component == 'ak-stage-password':
+        return {'component': component, 'password': password}
+    return None
+
+
+@metrics.timed('authentik.execute_flow')
+async def execute_flow(slug: str, username: str, password: str, until: str) -> dict | None:
     """
-    try:
-        session = requests.Session()
+    Drive an Authentik flow through the executor API, stage by stage.
 
-        # Step 1: Initiate the TOTP enrollment flow
-        logger.info(f"Initiating TOTP enrollment flow for user {username}...")
-        flow_url = f"{AUTHENTIK_URL}/api/v3/flows/executor/default-authenticator-totp-setup/"
+    Identification and password stages are answered with the given
+    credentials until a challenge containing the `until` key is returned.
+    Each flow uses its own cookie jar on top of the shared connection pool.
+    Returns that challenge, or None on failure.
+    """
+    if _flow_transport is None:
+        init_client()
+
+    flow_url = f"/api/v3/flows/executor/{slug}/"
+    async with httpx.AsyncClient(
+        base_url=AUTHENTIK_URL,
+        transport=_SharedTransport(_flow_transport),
+        timeout=AUTHENTIK_TIMEOUT,
+        follow_redirects=True,
+        event_hooks={'request': [tracing.inject_headers]}
+    ) as session:
+        response = await session.get(flow_url)
+
+        for _ in range(FLOW_MAX_STAGES):
+            if response.status_code != 200:
+                logger.error("Flow '%s' request failed: %s - %s", slug, response.status_code, response.text)
+                return None
 
-        # Get the initial challenge
-        response = session.get(flow_url, timeout=10)
+            challenge = response.json()
+            component = challenge.get('component', '')
 
-        if response.status_code != 200:
-            logger.error(f"Failed to initiate TOTP flow: {response.status_code} - {response.text}")
-            return None
+            if until in challenge:
+                return challenge
 
-        challenge_data = response.json()
-        logger.info(f"Flow initiated. Challenge type: {challenge_data.get('type')}")
-
-        # Step 2: Check if we need to authenticate first
-        component = challenge_data.get('component', '')
-
-        if 'identification' in component.lower():
-            # Need to authenticate
-            logger.info("Authenticating user for TOTP enrollment...")
-            auth_response = session.post(
-                flow_url,
-                json={
-                    'component': component,
-                    'uid_field': username,
-                    'password': password
-                },
-                timeout=10
-            )
+            if component == 'ak-stage-access-denied':
+                logger.error("Flow '%s' denied access: %s", slug, challenge.get('error_message'))
+                return None
 
-            if auth_response.status_code != 200:
-                logger.error(f"Authentication failed: {auth_response.status_code} - {auth_response.text}")
+            answer = _stage_response(challenge, username, password)
+            if answer is None:
+                logger.error("Flow '%s' stopped at unsupported stage: %s", slug, component)
+                logger.debug("Full response: %s", challenge)
                 return None
 
-            challenge_data = auth_response.json()
-            logger.info(f"Authenticated. New component: {challenge_data.get('component')}")
-
-        # Step 3: Look for TOTP stage response
-        # The challenge should now contain the config_url
-        if 'config_url' in challenge_data:
-            config_url = challenge_data['config_url']
-            logger.info(f"Received TOTP config URL")
-
-            # Generate QR code
-            qr_code_bytes = generate_qr_code(config_url)
-
-            return {
-                'config_url': config_url,
-                'qr_code': qr_code_bytes
-            }
-        else:
-            logger.error(f"config_url not found in response. Component: {challenge_data.get('component')}")
-            logger.debug(f"Full response: {challenge_data}")
-            return None
+            logger.info("Flow '%s': answering stage %s", slug, component)
+            response = await session.post(flow_url, json=answer)
 
-    except Exception as e:
-        logger.error(f"Error enrolling TOTP: {str(e)}", exc_info=True)
-        return None
+    logger.error("Flow '%s' did not finish within %s stages", slug, FLOW_MAX_STAGES)
+    return None
 
 
-def generate_qr_code(data: str) -> bytes:
+@metrics.timed('authentik.enroll_totp')
+async def enroll_totp(username: str, password: str) -> dict | None:
     """
-    Generate a QR code image from the given data.
-    Returns the QR code as PNG bytes.
+    Enroll TOTP for a user by executing the enrollment flow.
+    Returns dict with 'config_url' and 'qr_code' (bytes) or None on failure.
     """
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
+        logger.info("Initiating TOTP enrollment flow for user %s...", username)
+        challenge_data = await resilience.call(
+            resilience.authentik_breaker,
+            execute_flow,
+            "default-authenticator-totp-setup",
+            username,
+            password,
+            until='config_url',
+            retries=AUTHENTIK_MAX_RETRIES,
+            is_transient=lambda e: isinstance(e, httpx.TransportError)
         )
-        qr.add_data(data)
-        qr.make(fit=True)
 
-        img = qr.make_image(fill_color="black", back_color="white")
+        if not challenge_data:
+            return None
 
-        # Convert to bytes
-        img_bytes = io.BytesIO()
-        img.save(img_bytes, format='PNG')
-        img_bytes.seek(0)
+        config_url = challenge_data['config_url']
+        logger.info("Received TOTP config URL")
 
-        return img_bytes.getvalue()
+        # Generate QR code
+        qr_code_bytes = await render_qr_code(config_url)
 
+        return {
+            'config_url': config_url,
+            'qr_code': qr_code_bytes
+        }
+
+    except CircuitOpenError as e:
+        logger.error("Skipping TOTP enrollment: %s", e)
+        return None
     except Exception as e:
-        logger.error(f"Error generating QR code: {str(e)}", exc_info=True)
+        logger.error("Error enrolling TOTP: %s", e, exc_info=True)
         return None
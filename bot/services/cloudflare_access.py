@@ -2,19 +2,248 @@
 Cloudflare Access API integration for adding users to policies.
 """
 
-import os
-import requests
+import asyncio
 import logging
+import httpx
+from bot.services import resilience
+from bot.utils import metrics, tracing
+from bot.utils.config import (
+    CF_API_TOKEN,
+    CF_ACCOUNT_ID,
+    CF_ACCESS_POLICY_ID,
+    CF_ACCESS_GROUP_ID,
+    CF_TIMEOUT,
+    CF_MAX_RETRIES,
+    CF_POOL_SIZE,
+    CF_BATCH_WINDOW,
+    CF_BATCH_MAX,
+)
 
 logger = logging.getLogger(__name__)
 
-# Cloudflare API configuration
-CF_API_TOKEN = os.getenv('CF_API_TOKEN')
-CF_ACCOUNT_ID = os.getenv('CF_ACCOUNT_ID')
-CF_ACCESS_POLICY_ID = os.getenv('CF_ACCESS_POLICY_ID')  # The policy to add users to
+CF_API_BASE = "https://api.cloudflare.com/client/v4"
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Long-lived client with a keep-alive pool to api.cloudflare.com;
+# see init_client()/close_client()
+_client: httpx.AsyncClient | None = None
+
+# Resource path -> (modified_on, lowercased include emails). Rebuilt only when
+# Cloudflare reports a different modified_on, so membership checks are O(1).
+_include_cache: dict[str, tuple[str | None, set[str]]] = {}
+
+
+def init_client() -> None:
+    """Create the shared Cloudflare API client (called once at startup)."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=CF_API_BASE,
+            headers={
+                'Authorization': f'Bearer {CF_API_TOKEN}',
+                'Content-Type': 'application/json'
+            },
+            timeout=httpx.Timeout(CF_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=CF_POOL_SIZE,
+                max_keepalive_connections=CF_POOL_SIZE,
+                keepalive_expiry=60
+            ),
+            event_hooks={'request': [tracing.inject_headers]}
+        )
+        logger.info("Cloudflare API client ready")
+
+
+async def close_client() -> None:
+    """Close the shared Cloudflare API client and its connection pool."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Cloudflare API client closed")
+
+
+def _is_transient(error: Exception) -> bool:
+    """Return True for errors worth retrying: connection errors, 429 and 5xx."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+async def _request(method: str, path: str, **kwargs) -> httpx.Response:
+    """
+    Send a request to the Cloudflare API through the Cloudflare circuit
+    breaker, retrying transient failures (every call made here is idempotent).
+    """
+    if _client is None:
+        init_client()
+
+    async def attempt() -> httpx.Response:
+        response = await _client.request(method, path, **kwargs)
+        if response.status_code in RETRY_STATUS_CODES:
+            response.raise_for_status()
+        return response
+
+    return await resilience.call(
+        resilience.cloudflare_breaker,
+        attempt,
+        retries=CF_MAX_RETRIES,
+        is_transient=_is_transient
+    )
+
+
+def _get_include_emails(path: str, resource: dict) -> set[str]:
+    """Return the normalized include emails of a fetched resource, reusing the cache if unchanged."""
+    modified_on = resource.get('modified_on')
+    cached = _include_cache.get(path)
+    if cached and modified_on and cached[0] == modified_on:
+        return cached[1]
+
+    emails = set()
+    for rule in resource['include']:
+        if 'email' in rule and isinstance(rule['email'], dict):
+            emails.add(rule['email'].get('email', '').lower())
+
+    _include_cache[path] = (modified_on, emails)
+    return emails
+
+
+def _known_included(path: str, email: str) -> bool:
+    """Return True if the email is already known to be in the resource's include rules."""
+    cached = _include_cache.get(path)
+    return cached is not None and email.lower() in cached[1]
+
+
+@metrics.timed('cloudflare.update_include')
+async def _add_emails_to_include(path: str, kind: str, emails: list[str]) -> bool:
+    """Add email include rules to a Cloudflare Access policy or group in one GET + PUT."""
+    if all(_known_included(path, email) for email in emails):
+        logger.info("All %s email(s) already known in %s, skipping fetch", len(emails), kind)
+        return True
+
+    logger.info("Fetching Cloudflare Access %s %s", kind, path)
+    response = await _request('GET', path)
+
+    if response.status_code != 200:
+        logger.error("Failed to fetch Cloudflare %s: %s - %s", kind, response.status_code, response.text)
+        return False
 
+    resource = response.json()['result']
 
-def add_email_to_access_policy(email: str) -> bool:
+    # Check if the resource has an 'include' section
+    if 'include' not in resource:
+        resource['include'] = []
+
+    existing = _get_include_emails(path, resource)
+
+    missing = [email for email in emails if email.lower() not in existing]
+    if not missing:
+        logger.info("All %s email(s) already exist in %s", len(emails), kind)
+        return True
+
+    # Add the missing emails as new rules
+    for email in missing:
+        resource['include'].append({
+            'email': {'email': email.lower()}
+        })
+    logger.info("Added %s new email rule(s)", len(missing))
+
+    # Update the resource
+    logger.info("Updating Cloudflare Access %s", kind)
+    response = await _request('PUT', path, json=resource)
+
+    if response.status_code == 200:
+        logger.info("Successfully added %s email(s) to Cloudflare Access %s", len(missing), kind)
+        updated = response.json().get('result') or {}
+        existing.update(email.lower() for email in missing)
+        _include_cache[path] = (updated.get('modified_on'), existing)
+        return True
+
+    logger.error("Failed to update Cloudflare %s: %s - %s", kind, response.status_code, response.text)
+    return False
+
+
+class IncludeBatcher:
+    """
+    Coalesce concurrent email additions to one policy or group.
+
+    Emails are collected for up to CF_BATCH_WINDOW seconds (or until
+    CF_BATCH_MAX are pending) and applied with a single GET + PUT. Updates to
+    the same resource are serialized, so concurrent signups can no longer
+    overwrite each other's additions.
+    """
+
+    def __init__(self, path: str, kind: str):
+        self.path = path
+        self.kind = kind
+        self._pending: dict[str, list[asyncio.Future]] = {}
+        self._full = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    async def add(self, email: str) -> bool:
+        """Queue an email and wait for the batch that applies it."""
+        if _known_included(self.path, email):
+            logger.info("Email %s already known in %s", email, self.kind)
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(email.lower(), []).append(future)
+
+        if len(self._pending) >= CF_BATCH_MAX:
+            self._full.set()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+        return await future
+
+    async def add_many(self, emails: list[str]) -> bool:
+        """Apply a list of emails right away in one update, in turn with any batch."""
+        async with self._lock:
+            logger.info("Applying %s email(s) to Cloudflare Access %s", len(emails), self.kind)
+            return await _add_emails_to_include(self.path, self.kind, emails)
+
+    async def _flush_later(self) -> None:
+        """Wait for the batch window (or a full batch), then flush."""
+        try:
+            await asyncio.wait_for(self._full.wait(), timeout=CF_BATCH_WINDOW)
+        except asyncio.TimeoutError:
+            pass
+
+        async with self._lock:
+            batch, self._pending = self._pending, {}
+            self._full.clear()
+            self._flush_task = None
+            # Emails queued while this batch is applied start the next one
+            if batch:
+                logger.info("Applying %s email(s) to Cloudflare Access %s", len(batch), self.kind)
+                try:
+                    success = await _add_emails_to_include(self.path, self.kind, list(batch))
+                except Exception as e:
+                    logger.error("Error updating Cloudflare Access %s: %s", self.kind, e, exc_info=True)
+                    success = False
+
+                for futures in batch.values():
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(success)
+
+
+# One batcher per Cloudflare resource path
+_batchers: dict[str, IncludeBatcher] = {}
+
+
+def _get_batcher(path: str, kind: str) -> IncludeBatcher:
+    """Return the batcher for a policy or group, creating it if needed."""
+    if path not in _batchers:
+        _batchers[path] = IncludeBatcher(path, kind)
+    return _batchers[path]
+
+
+@metrics.timed('cloudflare.add_email_to_access_policy')
+async def add_email_to_access_policy(email: str) -> bool:
     """
     Add an email to a Cloudflare Access policy.
 
@@ -29,69 +258,46 @@ def add_email_to_access_policy(email: str) -> bool:
         return False
 
     try:
-        # First, get the current policy to see its structure
-        headers = {
-            'Authorization': f'Bearer {CF_API_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-
-        # Get the current policy
-        get_url = f"https://api.cloudflare.com/client/v4/accounts/{CF_ACCOUNT_ID}/access/policies/{CF_ACCESS_POLICY_ID}"
-
-        logger.info(f"Fetching Cloudflare Access policy {CF_ACCESS_POLICY_ID}")
-        response = requests.get(get_url, headers=headers, timeout=10)
-
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch Cloudflare policy: {response.status_code} - {response.text}")
-            return False
-
-        policy = response.json()['result']
-
-        # Check if the policy has an 'include' section
-        if 'include' not in policy:
-            policy['include'] = []
-
-        # Check if email already exists in policy
-        email_exists = False
-        for rule in policy['include']:
-            if 'email' in rule and isinstance(rule['email'], dict):
-                if rule['email'].get('email', '').lower() == email.lower():
-                    email_exists = True
-                    logger.info(f"Email {email} already exists in policy")
-                    break
-
-        # If email doesn't exist, add it as a new rule
-        if not email_exists:
-            policy['include'].append({
-                'email': {'email': email.lower()}
-            })
-            logger.info(f"Added new email rule for {email}")
-
-            # Update the policy
-            logger.info(f"Updating Cloudflare Access policy")
-            response = requests.put(
-                get_url,
-                headers=headers,
-                json=policy,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                logger.info(f"Successfully added {email} to Cloudflare Access policy")
-                return True
-            else:
-                logger.error(f"Failed to update Cloudflare policy: {response.status_code} - {response.text}")
-                return False
-        else:
-            # Email already exists, return True
-            return True
+        batcher = _get_batcher(
+            f"/accounts/{CF_ACCOUNT_ID}/access/policies/{CF_ACCESS_POLICY_ID}",
+            "policy"
+        )
+        return await batcher.add(email)
 
     except Exception as e:
-        logger.error(f"Error adding email to Cloudflare Access: {e}", exc_info=True)
+        logger.error("Error adding email to Cloudflare Access: %s", e, exc_info=True)
         return False
 
 
-def add_email_to_access_group(email: str) -> bool:
+@metrics.timed('cloudflare.add_emails_to_access_policy')
+async def add_emails_to_access_policy(emails: list[str]) -> bool:
+    """
+    Add many emails to a Cloudflare Access policy with a single update.
+
+    Args:
+        emails: Email addresses to add to the policy
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not all([CF_API_TOKEN, CF_ACCOUNT_ID, CF_ACCESS_POLICY_ID]):
+        logger.warning("Cloudflare Access credentials not configured, skipping policy update")
+        return False
+
+    try:
+        batcher = _get_batcher(
+            f"/accounts/{CF_ACCOUNT_ID}/access/policies/{CF_ACCESS_POLICY_ID}",
+            "policy"
+        )
+        return await batcher.add_many(emails)
+
+    except Exception as e:
+        logger.error("Error adding emails to Cloudflare Access: %s", e, exc_info=True)
+        return False
+
+
+@metrics.timed('cloudflare.add_email_to_access_group')
+async def add_email_to_access_group(email: str) -> bool:
     """
     Alternative: Add email to a Cloudflare Access Group instead of directly to policy.
     This is cleaner and more maintainable.
@@ -102,66 +308,17 @@ def add_email_to_access_group(email: str) -> bool:
     Returns:
         bool: True if successful, False otherwise
     """
-    CF_ACCESS_GROUP_ID = os.getenv('CF_ACCESS_GROUP_ID')
-
     if not all([CF_API_TOKEN, CF_ACCOUNT_ID, CF_ACCESS_GROUP_ID]):
         logger.warning("Cloudflare Access Group credentials not configured")
         return False
 
     try:
-        headers = {
-            'Authorization': f'Bearer {CF_API_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-
-        # Get the current group
-        get_url = f"https://api.cloudflare.com/client/v4/accounts/{CF_ACCOUNT_ID}/access/groups/{CF_ACCESS_GROUP_ID}"
-
-        logger.info(f"Fetching Cloudflare Access group {CF_ACCESS_GROUP_ID}")
-        response = requests.get(get_url, headers=headers, timeout=10)
-
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch Cloudflare group: {response.status_code} - {response.text}")
-            return False
-
-        group = response.json()['result']
-
-        # Add email to the group's include list
-        if 'include' not in group:
-            group['include'] = []
-
-        # Check if email already exists
-        email_exists = False
-        for rule in group['include']:
-            if 'email' in rule:
-                if isinstance(rule['email'], dict) and rule['email'].get('email') == email.lower():
-                    email_exists = True
-                    logger.info(f"Email {email} already in group")
-                    break
-
-        if not email_exists:
-            group['include'].append({
-                'email': {'email': email.lower()}
-            })
-
-            # Update the group
-            logger.info(f"Updating Cloudflare Access group")
-            response = requests.put(
-                get_url,
-                headers=headers,
-                json=group,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                logger.info(f"Successfully added {email} to Cloudflare Access group")
-                return True
-            else:
-                logger.error(f"Failed to update Cloudflare group: {response.status_code} - {response.text}")
-                return False
-
-        return True
+        batcher = _get_batcher(
+            f"/accounts/{CF_ACCOUNT_ID}/access/groups/{CF_ACCESS_GROUP_ID}",
+            "group"
+        )
+        return await batcher.add(email)
 
     except Exception as e:
-        logger.error(f"Error adding email to Cloudflare Access group: {e}", exc_info=True)
+        logger.error("Error adding email to Cloudflare Access group: %s", e, exc_info=True)
         return False
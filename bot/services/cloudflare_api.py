@@ -9,7 +9,7 @@ CLOUDFLARE_ENABLED = all([CF_API_TOKEN, CF_ACCOUNT_ID, CF_ACCESS_POLICY_ID])
 
 if CLOUDFLARE_ENABLED:
     try:
-        from bot.services.cloudflare_access import add_email_to_access_policy
+        from bot.services.cloudflare_access import add_email_to_access_policy, add_emails_to_access_policy
         logger.info("Cloudflare Access module loaded successfully")
     except ImportError:
         logger.warning("cloudflare_access module not found, Cloudflare integration disabled")
@@ -25,16 +25,31 @@ async def add_email_to_access(email: str) -> bool:
         return False
 
     try:
-        logger.info(f"Adding {email} to Cloudflare Access policy...")
-        success = add_email_to_access_policy(email)
+        logger.info("Adding %s to Cloudflare Access policy...", email)
+        success = await add_email_to_access_policy(email)
 
         if success:
-            logger.info(f"Successfully added {email} to Cloudflare Access policy")
+            logger.info("Successfully added %s to Cloudflare Access policy", email)
             return True
         else:
-            logger.warning(f"Failed to add {email} to Cloudflare Access policy")
+            logger.warning("Failed to add %s to Cloudflare Access policy", email)
             return False
 
     except Exception as e:
-        logger.error(f"Error adding email to Cloudflare Access: {str(e)}", exc_info=True)
+        logger.error("Error adding email to Cloudflare Access: %s", e, exc_info=True)
+        return False
+
+
+async def add_emails_to_access(emails: list[str]) -> bool:
+    """Add many emails to Cloudflare Access policy in one update."""
+    if not CLOUDFLARE_ENABLED:
+        logger.warning("Cloudflare Access is not enabled")
+        return False
+
+    try:
+        logger.info("Adding %s emails to Cloudflare Access policy...", len(emails))
+        return await add_emails_to_access_policy(emails)
+
+    except Exception as e:
+        logger.error("Error adding emails to Cloudflare Access: %s", e, exc_info=True)
         return False
@@ -0,0 +1,132 @@
+"""
+Single-use, expiring invite tokens.
+
+Admins mint tokens with /invite; a user who opens the deep link
+`t.me/<bot>?start=<token>` skips the bot password. Only a SHA-256 digest of
+each token is kept, in a dict for O(1) redemption, with a heap ordered by
+expiry so sweeping never scans the outstanding invites. With INVITE_DB set,
+invites are also written to SQLite and reloaded at startup.
+"""
+import asyncio
+import hashlib
+import heapq
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from bot.utils.config import INVITE_DB, INVITE_TTL, INVITE_SWEEP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SQLiteInviteStore:
+    """Invite digests and expiry times backed by a local SQLite file."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS invites (digest TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+
+    def _save(self, digest: str, expires_at: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO invites (digest, expires_at) VALUES (?, ?)", (digest, expires_at))
+
+    def _delete(self, digests: list[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM invites WHERE digest = ?", [(d,) for d in digests])
+
+    def _load(self) -> list[tuple[str, float]]:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM invites WHERE expires_at <= ?", (time.time(),))
+            return self._conn.execute("SELECT digest, expires_at FROM invites").fetchall()
+
+    async def save(self, digest: str, expires_at: float) -> None:
+        await asyncio.to_thread(self._save, digest, expires_at)
+
+    async def delete(self, digests: list[str]) -> None:
+        await asyncio.to_thread(self._delete, digests)
+
+    async def load(self) -> list[tuple[str, float]]:
+        return await asyncio.to_thread(self._load)
+
+
+class InviteRegistry:
+    """Outstanding invites, optionally mirrored to a store."""
+
+    def __init__(self, store: SQLiteInviteStore | None = None):
+        self._store = store
+        self._expiry: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    async def load(self) -> None:
+        """Reload unexpired invites from the store."""
+        if self._store is None:
+            return
+        for digest, expires_at in await self._store.load():
+            self._expiry[digest] = expires_at
+        self._heap = [(expires_at, digest) for digest, expires_at in self._expiry.items()]
+        heapq.heapify(self._heap)
+        logger.info("Loaded %s outstanding invite(s)", len(self._expiry))
+
+    async def create(self, ttl: float = INVITE_TTL) -> str:
+        """Mint a new invite token valid for ttl seconds."""
+        token = secrets.token_urlsafe(16)
+        digest = _digest(token)
+        expires_at = time.time() + ttl
+        self._expiry[digest] = expires_at
+        heapq.heappush(self._heap, (expires_at, digest))
+        if self._store is not None:
+            await self._store.save(digest, expires_at)
+        return token
+
+    async def redeem(self, token: str) -> bool:
+        """Consume an invite. Returns True if it existed and had not expired."""
+        digest = _digest(token)
+        expires_at = self._expiry.pop(digest, None)
+        if expires_at is None:
+            return False
+        if self._store is not None:
+            await self._store.delete([digest])
+        return expires_at > time.time()
+
+    async def sweep(self) -> int:
+        """Drop expired invites. Returns how many were removed."""
+        now = time.time()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, digest = heapq.heappop(self._heap)
+            # Redeemed invites leave a stale heap entry behind; skip those
+            if self._expiry.get(digest) == expires_at:
+                del self._expiry[digest]
+                expired.append(digest)
+        if expired and self._store is not None:
+            await self._store.delete(expired)
+        return len(expired)
+
+
+registry = InviteRegistry(SQLiteInviteStore(INVITE_DB) if INVITE_DB else None)
+
+
+async def sweep_periodically() -> None:
+    """Remove expired invites every INVITE_SWEEP_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(INVITE_SWEEP_INTERVAL)
+        try:
+            expired = await registry.sweep()
+            if expired:
+                logger.info("Removed %s expired invite(s)", expired)
+        except Exception as e:
+            logger.warning("Invite sweep failed: %s", e)
@@ -0,0 +1,199 @@
+"""
+Background provisioning job queue.
+
+The password handler enqueues a job and returns immediately; worker tasks
+run the Authentik + Cloudflare + TOTP chain and push the result to the chat.
+Jobs are kept in a pluggable store (in-memory or SQLite) so they survive a
+restart, and failed jobs are retried with exponential backoff.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, asdict
+from bot.utils import metrics
+from bot.utils.encryption import encrypt, decrypt
+from bot.utils.config import (
+    PROVISION_WORKERS,
+    PROVISION_MAX_ATTEMPTS,
+    PROVISION_RETRY_DELAY,
+    PROVISION_JOB_DB,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProvisioningJob:
+    """A pending user registration."""
+    chat_id: int
+    user_id: int
+    email: str
+    username: str
+    password: str
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempts: int = 0
+    trace_id: str = ''
+
+
+class MemoryJobStore:
+    """Job store that keeps nothing; jobs are lost on restart."""
+
+    async def save(self, job: ProvisioningJob) -> None:
+        pass
+
+    async def delete(self, job_id: str) -> None:
+        pass
+
+    async def load(self) -> list[ProvisioningJob]:
+        return []
+
+
+class SQLiteJobStore:
+    """Job store backed by a local SQLite file. Payloads are encrypted."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, payload BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _save(self, job: ProvisioningJob) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, payload, updated_at) VALUES (?, ?, ?)",
+                (job.job_id, encrypt(json.dumps(asdict(job)).encode()), time.time())
+            )
+
+    def _delete(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def _load(self) -> list[ProvisioningJob]:
+        with self._lock:
+            rows = self._conn.execute("SELECT payload FROM jobs ORDER BY updated_at").fetchall()
+        return [ProvisioningJob(**json.loads(decrypt(payload))) for (payload,) in rows]
+
+    async def save(self, job: ProvisioningJob) -> None:
+        await asyncio.to_thread(self._save, job)
+
+    async def delete(self, job_id: str) -> None:
+        await asyncio.to_thread(self._delete, job_id)
+
+    async def load(self) -> list[ProvisioningJob]:
+        return await asyncio.to_thread(self._load)
+
+
+class ProvisioningQueue:
+    """
+    In-process asyncio queue with worker tasks.
+
+    `handler(job)` runs a job: returning means the job is finished (whether
+    it succeeded or failed permanently), raising means it should be retried.
+    `on_failure(job, error)` is called once a job has used all its attempts.
+    """
+
+    def __init__(self, store, handler, on_failure, workers: int = PROVISION_WORKERS):
+        self._store = store
+        self._handler = handler
+        self._on_failure = on_failure
+        self._workers = workers
+        self._queue: asyncio.Queue[ProvisioningJob] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Reload unfinished jobs and start the workers."""
+        jobs = await self._store.load()
+        for job in jobs:
+            self._queue.put_nowait(job)
+        if jobs:
+            logger.info("Resuming %s unfinished provisioning job(s)", len(jobs))
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"provisioning-worker-{n}")
+            for n in range(self._workers)
+        ]
+
+    async def stop(self) -> None:
+        """Stop the workers; unfinished jobs stay in the store."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def enqueue(self, job: ProvisioningJob) -> None:
+        """Persist a job and queue it for the workers."""
+        await self._store.save(job)
+        self._queue.put_nowait(job)
+        logger.info("Queued provisioning job %s for %s", job.job_id, job.username)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                # e.g. on_failure could not message a user who blocked the bot;
+                # keep the worker alive for the other jobs
+                logger.error("Error finishing provisioning job %s: %s", job.job_id, e, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: ProvisioningJob) -> None:
+        job.attempts += 1
+        metrics.provisioning_in_flight.inc()
+        try:
+            await self._handler(job)
+        except Exception as e:
+            if job.attempts >= PROVISION_MAX_ATTEMPTS:
+                logger.error("Provisioning job %s failed after %s attempts: %s", job.job_id, job.attempts, e)
+                await self._store.delete(job.job_id)
+                await self._on_failure(job, e)
+                return
+
+            delay = PROVISION_RETRY_DELAY * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5)
+            logger.warning(
+                "Provisioning job %s attempt %s failed (%s), retrying in %.1fs",
+                job.job_id, job.attempts, e, delay
+            )
+            await self._store.save(job)
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job)
+            return
+        finally:
+            metrics.provisioning_in_flight.dec()
+
+        await self._store.delete(job.job_id)
+
+
+_queue: ProvisioningQueue | None = None
+
+
+async def start(handler, on_failure) -> None:
+    """Create the job store and queue and start the workers (called at startup)."""
+    global _queue
+    store = SQLiteJobStore(PROVISION_JOB_DB) if PROVISION_JOB_DB else MemoryJobStore()
+    _queue = ProvisioningQueue(store, handler, on_failure)
+    await _queue.start()
+
+
+async def stop() -> None:
+    """Stop the workers (called on shutdown)."""
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue = None
+
+
+async def enqueue(job: ProvisioningJob) -> None:
+    """Queue a provisioning job."""
+    if _queue is None:
+        raise RuntimeError("Provisioning queue is not running")
+    await _queue.enqueue(job)
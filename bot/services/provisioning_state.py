@@ -0,0 +1,124 @@
+"""
+Per-username provisioning progress.
+
+Creating an account touches several upstreams (Authentik user, password,
+group, Cloudflare Access). Each completed step is recorded here, keyed by
+username, so a retried job resumes where the last attempt stopped instead of
+starting over. Records are kept in the provisioning job database when one is
+configured (encrypted, like the jobs) and in memory otherwise.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from bot.utils.encryption import encrypt, decrypt
+from bot.utils.config import PROVISION_JOB_DB
+
+# Steps in the order they are completed
+CREATE_REQUESTED = 'create_requested'
+CREATED = 'created'
+PASSWORD_SET = 'password_set'
+GROUPED = 'grouped'
+ACCESS_GRANTED = 'access_granted'
+
+
+class MemoryStateStore:
+    """State store held in process memory; progress is lost on restart."""
+
+    def __init__(self):
+        self._records: dict[str, dict] = {}
+
+    async def get(self, username: str) -> dict:
+        return dict(self._records.get(username.lower(), {}))
+
+    async def put(self, username: str, record: dict) -> None:
+        self._records[username.lower()] = dict(record)
+
+    async def delete(self, username: str) -> None:
+        self._records.pop(username.lower(), None)
+
+
+class SQLiteStateStore:
+    """State store backed by a local SQLite file. Records are encrypted."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS provisioning_state ("
+                "username TEXT PRIMARY KEY, record BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _get(self, username: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM provisioning_state WHERE username = ?", (username.lower(),)
+            ).fetchone()
+        return json.loads(decrypt(row[0])) if row else {}
+
+    def _put(self, username: str, record: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO provisioning_state (username, record, updated_at) VALUES (?, ?, ?)",
+                (username.lower(), encrypt(json.dumps(record).encode()), time.time())
+            )
+
+    def _delete(self, username: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM provisioning_state WHERE username = ?", (username.lower(),))
+
+    async def get(self, username: str) -> dict:
+        return await asyncio.to_thread(self._get, username)
+
+    async def put(self, username: str, record: dict) -> None:
+        await asyncio.to_thread(self._put, username, record)
+
+    async def delete(self, username: str) -> None:
+        await asyncio.to_thread(self._delete, username)
+
+
+_store = None
+_lock = asyncio.Lock()
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = SQLiteStateStore(PROVISION_JOB_DB) if PROVISION_JOB_DB else MemoryStateStore()
+    return _store
+
+
+async def get(username: str) -> dict:
+    """Return the progress record for a username (empty if none)."""
+    return await _get_store().get(username)
+
+
+async def is_resumable(username: str, email: str, owner: int | None) -> bool:
+    """
+    Whether an earlier attempt by `owner` (a Telegram user id, or None for
+    bulk imports) with this username and email left a half-made account.
+    """
+    state = await get(username)
+    return (
+        bool(state)
+        and state.get('owner') == owner
+        and state.get('email', '').lower() == email.lower()
+    )
+
+
+async def record(username: str, **fields) -> dict:
+    """Merge fields into the progress record for a username and save it."""
+    async with _lock:
+        state = await get(username)
+        state.update(fields)
+        await _get_store().put(username, state)
+    return state
+
+
+async def clear(username: str) -> None:
+    """Forget a username once provisioning has finished."""
+    await _get_store().delete(username)
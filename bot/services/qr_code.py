@@ -0,0 +1,49 @@
+"""QR code rendering service module."""
+import asyncio
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import qrcode
+from bot.utils import metrics
+from bot.utils.config import QR_BOX_SIZE, QR_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Rendering is CPU work; keep it off the event loop thread
+_executor = ThreadPoolExecutor(max_workers=QR_WORKERS, thread_name_prefix="qr")
+
+
+@metrics.timed('generate_qr_code')
+def generate_qr_code(data: str) -> bytes | None:
+    """
+    Generate a QR code image from the given data.
+    Returns the QR code as a 1-bit PNG.
+    """
+    try:
+        qr = qrcode.QRCode(
+            # Let fit=True pick the smallest version for the mixed-mode encoding
+            version=None,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=QR_BOX_SIZE,
+            border=4,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+
+        # Black on white renders as a 1-bit image, which keeps the PNG small
+        img = qr.make_image(fill_color="black", back_color="white")
+
+        # Convert to bytes
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format='PNG', optimize=True)
+        return img_bytes.getvalue()
+
+    except Exception as e:
+        logger.error("Error generating QR code: %s", e, exc_info=True)
+        return None
+
+
+async def render_qr_code(data: str) -> bytes | None:
+    """Generate a QR code on the rendering pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, generate_qr_code, data)
@@ -0,0 +1,139 @@
+"""Retries with backoff and circuit breakers for outbound services."""
+import asyncio
+import logging
+import random
+import time
+from bot.utils import metrics, tracing
+from bot.utils.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    After `failure_threshold` consecutive transient failures the circuit
+    opens and calls fail fast for `reset_timeout` seconds. Then a single
+    trial call is let through: success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if calls should fail fast right now."""
+        if self._opened_at is None:
+            return
+        elapsed = time.monotonic() - self._opened_at
+        if elapsed < self.reset_timeout or self._trial_running:
+            raise CircuitOpenError(self.name, max(0.0, self.reset_timeout - elapsed))
+        # Half-open: let one trial call through
+        self._trial_running = True
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("Circuit for %s closed", self.name)
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def release_trial(self) -> None:
+        """Free the half-open trial slot without judging the upstream (e.g. the call was cancelled)."""
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_running = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.error("Circuit for %s opened after %s failures", self.name, self._failures)
+            self._opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int) -> float:
+    """Jittered exponential delay before retry number `attempt` (1-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+async def call(breaker: CircuitBreaker, func, *args, retries: int = 0, is_transient=None, **kwargs):
+    """
+    Await `func(*args, **kwargs)` through a circuit breaker.
+
+    Failures for which `is_transient(error)` is true count against the
+    breaker and are retried up to `retries` times with jittered exponential
+    backoff. Only pass retries for idempotent calls. Other errors are
+    re-raised at once and do not count as upstream failures.
+    """
+    upstream = breaker.name.lower()
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            metrics.upstream_errors.inc(upstream=upstream, kind='circuit_open')
+            raise
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"{upstream}.request", attempt=attempt + 1):
+                result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Cancelled by an outer timeout or shutdown; says nothing about the upstream
+            breaker.release_trial()
+            raise
+        except Exception as e:
+            metrics.upstream_duration.observe(time.perf_counter() - start, upstream=upstream)
+            if is_transient is None or not is_transient(e):
+                # The upstream answered (e.g. a 4xx); it is healthy
+                metrics.upstream_errors.inc(upstream=upstream, kind='rejected')
+                breaker.record_success()
+                raise
+            metrics.upstream_errors.inc(upstream=upstream, kind='transient')
+            breaker.record_failure()
+            attempt += 1
+            if attempt > retries or breaker.is_open:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(
+                "%s call failed (%r), retry %s/%s in %.2fs",
+                breaker.name, e, attempt, retries, delay
+            )
+            await asyncio.sleep(delay)
+        else:
+            metrics.upstream_duration.observe(time.perf_counter() - start, upstream=upstream)
+            breaker.record_success()
+            return result
+
+
+# One breaker per upstream
+authentik_breaker = CircuitBreaker("Authentik")
+cloudflare_breaker = CircuitBreaker("Cloudflare")
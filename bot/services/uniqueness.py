@@ -0,0 +1,75 @@
+"""Background uniqueness checks for emails and usernames.
+
+Checks start as soon as a value is entered and run while the user types the
+next field. Results are cached per value, so resubmitting the same value or
+asking again at the final step reuses the in-flight or finished lookup.
+"""
+import asyncio
+import logging
+import time
+from bot.services.authentik_api import check_email_exists, check_username_exists
+from bot.utils.config import UNIQUENESS_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# (kind, lowercased value) -> (lookup task, expiry on the monotonic clock)
+_checks: dict[tuple[str, str], tuple[asyncio.Task, float]] = {}
+
+_CHECKERS = {
+    'email': check_email_exists,
+    'username': check_username_exists,
+}
+
+
+def _failed(task: asyncio.Task) -> bool:
+    """Return True if a finished lookup raised (e.g. Authentik was unavailable)."""
+    return task.done() and (task.cancelled() or task.exception() is not None)
+
+
+def _prune(now: float) -> None:
+    """Drop expired lookups."""
+    for key in [k for k, (_, expires) in _checks.items() if expires <= now]:
+        del _checks[key]
+
+
+def _get_check(kind: str, value: str) -> asyncio.Task:
+    """Return the cached lookup for a value, starting one if needed."""
+    now = time.monotonic()
+    key = (kind, value.lower())
+    cached = _checks.get(key)
+    if cached and cached[1] > now and not _failed(cached[0]):
+        return cached[0]
+
+    _prune(now)
+    logger.info("Starting background %s uniqueness check for %s", kind, value)
+    task = asyncio.create_task(_CHECKERS[kind](value))
+    _checks[key] = (task, now + UNIQUENESS_CACHE_TTL)
+    return task
+
+
+def prefetch_email(email: str) -> None:
+    """Start checking an email in the background."""
+    _get_check('email', email)
+
+
+def prefetch_username(username: str) -> None:
+    """Start checking a username in the background."""
+    _get_check('username', username)
+
+
+def known_taken(kind: str, value: str) -> bool:
+    """Return True if a finished lookup already found the value taken."""
+    cached = _checks.get((kind, value.lower()))
+    if not cached or not cached[0].done() or _failed(cached[0]):
+        return False
+    return cached[0].result() is True
+
+
+async def email_taken(email: str) -> bool:
+    """Return whether an email is registered, reusing a prefetched lookup."""
+    return await _get_check('email', email)
+
+
+async def username_taken(username: str) -> bool:
+    """Return whether a username is taken, reusing a prefetched lookup."""
+    return await _get_check('username', username)
@@ -1,85 +1,186 @@
 """User service module containing business logic for user operations."""
+import asyncio
 import logging
-from telegram import Update
-from telegram.ext import ContextTypes
-from bot.services.authentik_api import create_user, add_user_to_group, check_email_exists
-from bot.services.cloudflare_api import add_email_to_access
+from telegram import Bot
+from bot.services import provisioning_state
+from bot.services.authentik_api import create_user, find_user, set_user_password, add_user_to_group
+from bot.services.cloudflare_api import add_email_to_access, CLOUDFLARE_ENABLED
+from bot.services.uniqueness import email_taken
+from bot.services.provisioning_state import CREATE_REQUESTED, CREATED, PASSWORD_SET, GROUPED, ACCESS_GRANTED
+from bot.services.resilience import CircuitOpenError
+from bot.utils.config import JELLYFIN_GROUP, PROVISION_STEP_TIMEOUT
+from bot.utils import metrics
+from bot.utils.messaging import StatusMessage
 
 logger = logging.getLogger(__name__)
 
 
+class ProvisioningError(Exception):
+    """Raised when provisioning fails in a way that is worth retrying."""
+
+
+async def _run_step(name: str, coro) -> bool:
+    """Run one provisioning step with a timeout. Returns True on success."""
+    try:
+        return bool(await asyncio.wait_for(coro, timeout=PROVISION_STEP_TIMEOUT))
+    except asyncio.TimeoutError:
+        logger.warning("Provisioning step '%s' timed out after %ss", name, PROVISION_STEP_TIMEOUT)
+        return False
+    except Exception as e:
+        logger.error("Provisioning step '%s' failed: %s", name, e, exc_info=True)
+        return False
+
+
+async def ensure_account(
+    username: str,
+    email: str,
+    password: str,
+    state: dict,
+    owner: int | None = None,
+    job_id: str = ''
+) -> int | None:
+    """
+    Make sure the Authentik user exists and has its password, resuming from
+    the recorded state. `owner` is the Telegram user the account is made for
+    (None for bulk imports); only they can resume it. The password is set
+    again unless `job_id` (the job or run supplying it) already set it.
+    Returns the user pk, or None if the username turned out to belong to
+    someone else. Raises ProvisioningError to retry.
+    """
+    user_pk = state.get(CREATED)
+
+    if user_pk is None and state.get(CREATE_REQUESTED):
+        # An earlier attempt may have created the user before failing; adopt it
+        existing = await find_user(username)
+        if existing is not None:
+            if (existing.email or '').lower() != email.lower():
+                logger.error("Username %s was taken by another account meanwhile", username)
+                return None
+            logger.info("Adopting existing user %s (%s) from an earlier attempt", username, existing.pk)
+            user_pk = existing.pk
+
+    if user_pk is None:
+        await provisioning_state.record(username, email=email, owner=owner, **{CREATE_REQUESTED: True})
+        user_pk = await create_user(username, email)
+        if user_pk is None:
+            raise ProvisioningError(f"Failed to create user {username}")
+
+    state = await provisioning_state.record(username, **{CREATED: user_pk})
+
+    # A user who comes back in a new conversation brings a new password
+    if state.get(PASSWORD_SET) != job_id:
+        if not await set_user_password(user_pk, password):
+            raise ProvisioningError(f"Failed to set password for {username}")
+        await provisioning_state.record(username, **{PASSWORD_SET: job_id})
+
+    return user_pk
+
+
+@metrics.timed('create_and_setup_user')
 async def create_and_setup_user(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE,
+    bot: Bot,
+    chat_id: int,
+    user_id: int,
     email: str,
     username: str,
-    password: str
+    password: str,
+    job_id: str
 ) -> bool:
     """
     Create user in Authentik and set up all integrations.
-    Returns True if successful, False otherwise.
+    Returns True if successful, False on a permanent failure (already reported
+    to the chat). Raises ProvisioningError when the attempt should be retried.
+
+    Each completed step is recorded in provisioning_state, so a retry resumes
+    from the last completed step and never creates a second account.
     """
-    try:
-        # Check if email already exists
-        logger.info(f"Checking if email {email} already exists...")
-        if await check_email_exists(email):
-            await update.message.reply_text(
+    state = await provisioning_state.get(username)
+    if state and not await provisioning_state.is_resumable(username, email, user_id):
+        state = {}
+        await provisioning_state.clear(username)
+
+    # Check if email already exists (reuses the lookup started earlier). Skipped
+    # when resuming, since the account from the earlier attempt now has it.
+    if not state:
+        logger.info("Checking if email %s already exists...", email)
+        if await email_taken(email):
+            await bot.send_message(
+                chat_id,
                 f"❌ The email '{email}' is already registered.\n\n"
                 "Please try again with a different email.\n"
                 "Use /start to begin again."
             )
-            logger.error(f"Email already exists: {email}")
+            logger.error("Email already exists: %s", email)
             return False
 
-        # Create user in Authentik
-        await update.message.reply_text(
-            "⏳ Creating your account... Please wait."
+    # Create user in Authentik; progress is reported by editing one message
+    status = StatusMessage(bot, chat_id)
+    await status.update("⏳ Creating your account... Please wait.")
+
+    try:
+        user_pk = await ensure_account(username, email, password, state, owner=user_id, job_id=job_id)
+    except CircuitOpenError as e:
+        await status.update(
+            "⚠️ Our account service is temporarily unavailable.\n\n"
+            "I'll keep trying and message you here when your account is ready."
         )
+        raise ProvisioningError(str(e)) from e
+    except ProvisioningError:
+        await status.update("⚠️ Could not create your account yet, retrying shortly...")
+        raise
 
-        user_response = await create_user(username, email, password)
+    if user_pk is None:
+        await provisioning_state.clear(username)
+        await status.update(
+            f"❌ The username '{username}' is already taken.\n\n"
+            "Use /start to begin again with a different username."
+        )
+        return False
 
-        if not user_response:
-            await update.message.reply_text(
-                f"❌ Failed to create user.\n\n"
-                "Please try again with /start or contact an administrator."
-            )
-            return False
+    state = await provisioning_state.get(username)
+    lines = ["✅ User account created!"]
+    await status.update("\n\n".join(lines + ["⏳ Setting up access..."]))
 
-        user_pk = user_response.get('pk')
-        await update.message.reply_text("✅ User account created!")
-
-        # Add user to Jellyfin Users group
-        logger.info(f"Adding user {username} to Jellyfin Users group...")
-        group_success = await add_user_to_group(user_pk, "Jellyfin Users")
-        if group_success:
-            logger.info(f"Successfully added {username} to Jellyfin Users group")
-            await update.message.reply_text("✅ Added to Jellyfin Users group!")
-        else:
-            logger.warning(f"Failed to add {username} to Jellyfin Users group (non-critical)")
-            await update.message.reply_text(
-                "⚠️ Note: Could not automatically add you to Jellyfin Users group.\n"
-                "Please contact the administrator to be added manually."
-            )
+    async def group_step() -> bool:
+        if state.get(GROUPED):
+            return True
+        logger.info("Adding user %s to %s group...", username, JELLYFIN_GROUP)
+        done = await _run_step('group', add_user_to_group(user_pk, JELLYFIN_GROUP))
+        if done:
+            await provisioning_state.record(username, **{GROUPED: True})
+        return done
 
-        # Add email to Cloudflare Access policy
-        cf_success = await add_email_to_access(email)
-        if cf_success:
-            await update.message.reply_text(
-                "✅ Email added to access policy!\n\n"
-                "You now have access to protected services."
-            )
+    async def access_step() -> bool:
+        if state.get(ACCESS_GRANTED):
+            return True
+        done = await _run_step('cloudflare', add_email_to_access(email))
+        if done:
+            await provisioning_state.record(username, **{ACCESS_GRANTED: True})
+        return done
 
-        # Store user data for next steps
-        context.user_data['username'] = username
-        context.user_data['password'] = password
-        context.user_data['email'] = email
+    # Group membership and Cloudflare Access are independent, run them together
+    steps = [group_step()]
+    if CLOUDFLARE_ENABLED:
+        steps.append(access_step())
+    group_success, *cf_result = await asyncio.gather(*steps)
 
-        return True
+    if group_success:
+        logger.info("Successfully added %s to %s group", username, JELLYFIN_GROUP)
+        lines.append("✅ Added to Jellyfin Users group!")
+    else:
+        logger.warning("Failed to add %s to %s group (non-critical)", username, JELLYFIN_GROUP)
+        lines.append(
+            "⚠️ Note: Could not automatically add you to Jellyfin Users group.\n"
+            "Please contact the administrator to be added manually."
+        )
 
-    except Exception as e:
-        logger.error(f"Error in create_and_setup_user: {str(e)}", exc_info=True)
-        await update.message.reply_text(
-            f"❌ An error occurred: {str(e)}\n\n"
-            "Please try again with /start or contact an administrator."
+    if cf_result and cf_result[0]:
+        lines.append(
+            "✅ Email added to access policy!\n\n"
+            "You now have access to protected services."
         )
-        return False
+
+    await status.update("\n\n".join(lines))
+    await provisioning_state.clear(username)
+
+    return True
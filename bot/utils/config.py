@@ -12,23 +12,112 @@ load_dotenv()
 # Telegram Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 BOT_ACCESS_PASSWORD = os.getenv('BOT_PASSWORD')
+ADMIN_USER_IDS = {int(i) for i in os.getenv('ADMIN_USER_IDS', '').split(',') if i.strip()}  # may use /invite
+
+# Invite links: single-use tokens that skip the bot password
+INVITE_TTL = float(os.getenv('INVITE_TTL', '604800'))  # seconds an invite stays valid (7 days)
+INVITE_MAX_TTL = float(os.getenv('INVITE_MAX_TTL', '2592000'))  # longest validity /invite accepts (30 days)
+INVITE_DB = os.getenv('INVITE_DB')  # SQLite file for outstanding invites; in-memory if unset
+INVITE_SWEEP_INTERVAL = float(os.getenv('INVITE_SWEEP_INTERVAL', '300'))  # seconds between expiry sweeps
+
+# Update delivery: 'polling' (default) or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '0'))  # extra seconds between long polls
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public base URL Telegram posts updates to
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # verified against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+# Metrics: served by the webhook server, or on their own port in polling mode
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9090'))  # 0 disables the polling-mode endpoint
+# Tracing: one trace per registration, exported in batches
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', '').lower()  # 'jsonl', 'otlp', or unset for none
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')  # output of the jsonl exporter
+OTLP_ENDPOINT = os.getenv('OTLP_ENDPOINT')  # collector base URL for the otlp exporter, e.g. http://otel:4318
+TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '5'))  # seconds between exports
+SLOW_SIGNUP_THRESHOLD = float(os.getenv('SLOW_SIGNUP_THRESHOLD', '10'))  # seconds before the span tree is logged
+SLOW_SIGNUP_SAMPLE_RATE = float(os.getenv('SLOW_SIGNUP_SAMPLE_RATE', '1'))  # fraction of slow signups logged
+# Outbound Telegram messages
+TELEGRAM_MAX_RATE = float(os.getenv('TELEGRAM_MAX_RATE', '25'))  # bot API calls per second overall
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))  # retries after a RetryAfter (429)
+COALESCE_STATUS_MESSAGES = os.getenv('COALESCE_STATUS_MESSAGES', 'true').lower() == 'true'  # edit instead of resend
+
+# Flood control: token buckets per Telegram user and for the whole bot
+RATE_LIMIT_USER_RATE = float(os.getenv('RATE_LIMIT_USER_RATE', '1'))  # messages per second per user
+RATE_LIMIT_USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', '5'))
+RATE_LIMIT_GLOBAL_RATE = float(os.getenv('RATE_LIMIT_GLOBAL_RATE', '20'))  # messages per second overall
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv('RATE_LIMIT_GLOBAL_BURST', '50'))
+BOT_PASSWORD_MAX_ATTEMPTS = int(os.getenv('BOT_PASSWORD_MAX_ATTEMPTS', '3'))  # failures before lockout
+BOT_PASSWORD_LOCKOUT = float(os.getenv('BOT_PASSWORD_LOCKOUT', '60'))  # first lockout in seconds (doubles)
+BOT_PASSWORD_FAILURE_WINDOW = float(os.getenv('BOT_PASSWORD_FAILURE_WINDOW', '3600'))  # quiet seconds that forget failures
+
+# Idle registrations are evicted after these many seconds
+CONVERSATION_TIMEOUT = float(os.getenv('CONVERSATION_TIMEOUT', '900'))  # while entering details
+TOTP_CONFIRM_TIMEOUT = float(os.getenv('TOTP_CONFIRM_TIMEOUT', '3600'))  # while setting up 2FA
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '60'))  # seconds between sweeps
+
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))  # updates handled in parallel (ordered per chat)
+
+# Persistence (Optional): keep conversations and user_data across restarts
+PERSISTENCE_DB = os.getenv('PERSISTENCE_DB')  # SQLite file; in-memory only if unset
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', '10'))  # seconds between writes
+DATA_ENCRYPTION_KEY = os.getenv('DATA_ENCRYPTION_KEY')  # Fernet key for data stored on disk
 
 # Authentik Configuration
 AUTHENTIK_URL = os.getenv('AUTHENTIK_URL')
 AUTHENTIK_API_TOKEN = os.getenv('AUTHENTIK_API_TOKEN')
 JELLYFIN_URL = os.getenv('JELLYFIN_URL')
+JELLYFIN_GROUP = os.getenv('JELLYFIN_GROUP', 'Jellyfin Users')
+
+# Authentik client tuning
+AUTHENTIK_TIMEOUT = float(os.getenv('AUTHENTIK_TIMEOUT', '10'))  # seconds per API call
+AUTHENTIK_MAX_CONCURRENCY = int(os.getenv('AUTHENTIK_MAX_CONCURRENCY', '16'))  # parallel API calls
+AUTHENTIK_MAX_RETRIES = int(os.getenv('AUTHENTIK_MAX_RETRIES', '2'))  # retries for idempotent calls
+AUTHENTIK_POOL_SIZE = int(os.getenv('AUTHENTIK_POOL_SIZE', str(AUTHENTIK_MAX_CONCURRENCY)))  # kept-alive connections
+FLOW_MAX_STAGES = int(os.getenv('FLOW_MAX_STAGES', '10'))  # stages answered before a flow is abandoned
+GROUP_CACHE_TTL = float(os.getenv('GROUP_CACHE_TTL', '600'))  # seconds a group name -> pk lookup is cached
+
+# Local index of existing emails/usernames (Optional)
+USER_INDEX_ENABLED = os.getenv('USER_INDEX_ENABLED', 'false').lower() == 'true'
+USER_INDEX_SYNC_INTERVAL = float(os.getenv('USER_INDEX_SYNC_INTERVAL', '300'))  # seconds between syncs
+USER_INDEX_PAGE_SIZE = int(os.getenv('USER_INDEX_PAGE_SIZE', '500'))
+UNIQUENESS_CACHE_TTL = float(os.getenv('UNIQUENESS_CACHE_TTL', '60'))  # seconds an email/username check is reused
+
+# Resilience for outbound services
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.5'))  # seconds, doubled per retry (jittered)
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '5'))  # cap on the delay between retries
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))  # failures that open a circuit
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))  # seconds a circuit stays open
+
+# Provisioning
+PROVISION_STEP_TIMEOUT = float(os.getenv('PROVISION_STEP_TIMEOUT', '30'))  # seconds per post-creation step
+PROVISION_WORKERS = int(os.getenv('PROVISION_WORKERS', '4'))  # background provisioning workers
+PROVISION_MAX_ATTEMPTS = int(os.getenv('PROVISION_MAX_ATTEMPTS', '5'))  # attempts before a job is given up
+PROVISION_RETRY_DELAY = float(os.getenv('PROVISION_RETRY_DELAY', '5'))  # base seconds between attempts (doubles)
+PROVISION_JOB_DB = os.getenv('PROVISION_JOB_DB')  # SQLite file for durable jobs and step progress; in-memory if unset
+
+# QR code rendering
+QR_BOX_SIZE = int(os.getenv('QR_BOX_SIZE', '6'))  # pixels per QR module; smaller means a smaller upload
+QR_WORKERS = int(os.getenv('QR_WORKERS', '2'))  # threads rendering QR codes
 
 # Cloudflare Configuration (Optional)
 CF_API_TOKEN = os.getenv('CF_API_TOKEN')
 CF_ACCOUNT_ID = os.getenv('CF_ACCOUNT_ID')
 CF_ACCESS_POLICY_ID = os.getenv('CF_ACCESS_POLICY_ID')
+CF_ACCESS_GROUP_ID = os.getenv('CF_ACCESS_GROUP_ID')
+CF_TIMEOUT = float(os.getenv('CF_TIMEOUT', '10'))  # seconds per Cloudflare API call
+CF_MAX_RETRIES = int(os.getenv('CF_MAX_RETRIES', '2'))  # retries for transient Cloudflare errors
+CF_POOL_SIZE = int(os.getenv('CF_POOL_SIZE', '10'))  # kept-alive connections to api.cloudflare.com
+CF_BATCH_WINDOW = float(os.getenv('CF_BATCH_WINDOW', '0.5'))  # seconds to collect emails per policy update
+CF_BATCH_MAX = int(os.getenv('CF_BATCH_MAX', '50'))  # emails that trigger an immediate policy update
 
 # Debug: Print what was loaded (first few chars only for security)
-logger.info(f"Loaded TELEGRAM_BOT_TOKEN: {'Yes' if TELEGRAM_BOT_TOKEN else 'No'}")
-logger.info(f"Loaded AUTHENTIK_URL: {AUTHENTIK_URL[:30] if AUTHENTIK_URL else 'No'}...")
-logger.info(f"Loaded AUTHENTIK_API_TOKEN: {'Yes' if AUTHENTIK_API_TOKEN else 'No'}")
-logger.info(f"Loaded JELLYFIN_URL: {JELLYFIN_URL[:30] if JELLYFIN_URL else 'No'}...")
-logger.info(f"Loaded BOT_PASSWORD: {'Yes' if BOT_ACCESS_PASSWORD else 'No (bot is public!)'}")
+logger.info("Loaded TELEGRAM_BOT_TOKEN: %s", 'Yes' if TELEGRAM_BOT_TOKEN else 'No')
+logger.info("Loaded AUTHENTIK_URL: %s...", AUTHENTIK_URL[:30] if AUTHENTIK_URL else 'No')
+logger.info("Loaded AUTHENTIK_API_TOKEN: %s", 'Yes' if AUTHENTIK_API_TOKEN else 'No')
+logger.info("Loaded JELLYFIN_URL: %s...", JELLYFIN_URL[:30] if JELLYFIN_URL else 'No')
+logger.info("Loaded BOT_PASSWORD: %s", 'Yes' if BOT_ACCESS_PASSWORD else 'No (bot is public!)')
 
 
 def validate_config() -> bool:
@@ -37,4 +126,17 @@ def validate_config() -> bool:
         logger.error("Missing required environment variables!")
         logger.error("Please set: TELEGRAM_BOT_TOKEN, AUTHENTIK_URL, AUTHENTIK_API_TOKEN, JELLYFIN_URL")
         return False
+    if (PERSISTENCE_DB or PROVISION_JOB_DB) and not DATA_ENCRYPTION_KEY:
+        logger.error("PERSISTENCE_DB and PROVISION_JOB_DB store passwords and require DATA_ENCRYPTION_KEY")
+        return False
+    if PERSISTENCE_DB and not PROVISION_JOB_DB:
+        # Otherwise a restart loses queued jobs while their users stay 'pending' forever
+        logger.error("PERSISTENCE_DB requires PROVISION_JOB_DB")
+        return False
+    if TRACE_EXPORTER == 'otlp' and not OTLP_ENDPOINT:
+        logger.error("TRACE_EXPORTER=otlp requires OTLP_ENDPOINT")
+        return False
+    if BOT_MODE == 'webhook' and not all([WEBHOOK_URL, WEBHOOK_SECRET]):
+        logger.error("Webhook mode requires WEBHOOK_URL and WEBHOOK_SECRET")
+        return False
     return True
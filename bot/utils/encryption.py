@@ -0,0 +1,20 @@
+"""Symmetric encryption for data stored on disk."""
+from cryptography.fernet import Fernet
+from bot.utils.config import DATA_ENCRYPTION_KEY
+
+_fernet = Fernet(DATA_ENCRYPTION_KEY) if DATA_ENCRYPTION_KEY else None
+
+
+def encryption_enabled() -> bool:
+    """Return True if a DATA_ENCRYPTION_KEY is configured."""
+    return _fernet is not None
+
+
+def encrypt(data: bytes) -> bytes:
+    """Encrypt data with DATA_ENCRYPTION_KEY (returned unchanged if no key is set)."""
+    return _fernet.encrypt(data) if _fernet else data
+
+
+def decrypt(token: bytes) -> bytes:
+    """Decrypt data written by encrypt()."""
+    return _fernet.decrypt(token) if _fernet else token
@@ -0,0 +1,130 @@
+"""
+Non-blocking logging.
+
+Loggers only cap each message and put the record on an in-memory queue; a
+listener thread redacts, formats (JSON lines by default) and writes them to
+stderr, so a slow console or a large payload never stalls the event loop.
+
+This runs before bot.utils.config is imported (so the configuration's own
+startup logs are captured), hence it reads its settings from the
+environment itself:
+
+    LOG_LEVEL        root level (default INFO)
+    LOG_FORMAT       'json' (default) or 'text'
+    LOG_MAX_MESSAGE  characters kept of each message and traceback (default 4096)
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_MAX_MESSAGE = int(os.getenv('LOG_MAX_MESSAGE', '4096'))
+
+_EMAIL_RE = re.compile(r'([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})')
+_SECRET_RE = re.compile(r'''((?:password|passwd|secret)["']?\s*[:=]\s*["']?)[^"',\s}]+''', re.IGNORECASE)
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= LOG_MAX_MESSAGE:
+        return text
+    # Cut at whitespace where possible, so a split email or secret can still be redacted
+    end = text.rfind(' ', LOG_MAX_MESSAGE // 2, LOG_MAX_MESSAGE)
+    end = end if end != -1 else LOG_MAX_MESSAGE
+    return f"{text[:end]}... [{len(text) - end} chars truncated]"
+
+
+def redact(text: str) -> str:
+    """Mask email addresses and password/secret values."""
+    text = _EMAIL_RE.sub(r'\1***@\2', text)
+    return _SECRET_RE.sub(r'\1[REDACTED]', text)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue records with their arguments merged; everything else happens in the listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merging here keeps later changes to mutable arguments out of the
+        # message. The queue is in-process, so exc_info can be passed along
+        # and the traceback rendered by the listener. Capping the message
+        # here keeps a large payload from being held in the queue.
+        record = copy.copy(record)
+        record.msg = _truncate(record.getMessage())
+        record.args = None
+        return record
+
+
+class _TraceIdFilter(logging.Filter):
+    """Tag records with the trace id of the span they were logged in."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Looked up lazily: tracing (and the config it reads) loads after logging is set up
+        current_span = getattr(sys.modules.get('bot.utils.tracing'), 'current_span', None)
+        span = current_span() if current_span is not None else None
+        record.trace_id = span.trace_id if span is not None else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with redacted and size-capped text."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact(record.getMessage()),
+        }
+        if getattr(record, 'trace_id', None):
+            entry['trace_id'] = record.trace_id
+        if record.exc_info:
+            entry['exception'] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False)
+
+    def formatException(self, ei) -> str:
+        return _truncate(super().formatException(ei))
+
+
+class TextFormatter(logging.Formatter):
+    """The classic text format, with redacted and size-capped text."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+    def formatException(self, ei) -> str:
+        return _truncate(super().formatException(ei))
+
+
+def configure_logging() -> None:
+    """Route all logging through a queue to a background writer thread."""
+    records: queue.SimpleQueue = queue.SimpleQueue()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    listener = logging.handlers.QueueListener(records, output)
+
+    handler = _QueueHandler(records)
+    handler.addFilter(_TraceIdFilter())
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    # httpx logs every request at INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    listener.start()
+    atexit.register(listener.stop)
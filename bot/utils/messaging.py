@@ -0,0 +1,32 @@
+"""Outbound message helpers."""
+import logging
+from telegram import Bot, Message
+from bot.utils.config import COALESCE_STATUS_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+
+class StatusMessage:
+    """
+    A chat status line that is edited in place.
+
+    With COALESCE_STATUS_MESSAGES enabled, the first update sends a message
+    and later updates edit it, so a multi-step operation costs one message
+    instead of one per step. Otherwise every update is sent as a new message.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self._message: Message | None = None
+
+    async def update(self, text: str, **kwargs) -> None:
+        """Show new status text."""
+        if COALESCE_STATUS_MESSAGES and self._message is not None:
+            try:
+                await self._message.edit_text(text, **kwargs)
+                return
+            except Exception as e:
+                logger.warning("Could not edit status message, sending a new one: %s", e)
+
+        self._message = await self.bot.send_message(self.chat_id, text, **kwargs)
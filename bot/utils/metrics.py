@@ -0,0 +1,174 @@
+"""
+In-process metrics in the Prometheus text format.
+
+A deliberately small registry: counters, gauges and histograms with labels,
+each update a dict lookup plus a bisect, cheap enough to leave on in
+production. `render()` produces the exposition served on /metrics.
+"""
+import bisect
+import functools
+import inspect
+import time
+from bot.utils import tracing
+
+# Latency buckets in seconds, from cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry: list = []
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {value:g}"
+            for key, value in list(self._values.items())
+        ]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down."""
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum."""
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf) and the running sum
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                labels = _format_labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Return every registered metric in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# Metrics shared across the bot
+step_duration = Histogram(
+    'bot_step_duration_seconds', "Time spent in each signup step.", ('step',)
+)
+step_errors = Counter(
+    'bot_step_errors_total', "Signup steps that raised.", ('step',)
+)
+upstream_duration = Histogram(
+    'bot_upstream_request_duration_seconds', "Time per upstream call attempt.", ('upstream',)
+)
+upstream_errors = Counter(
+    'bot_upstream_errors_total', "Failed upstream calls by upstream and kind.", ('upstream', 'kind')
+)
+handler_duration = Histogram(
+    'bot_handler_duration_seconds', "Time spent in each conversation handler.", ('handler',)
+)
+handler_errors = Counter(
+    'bot_handler_errors_total', "Conversation handlers that raised.", ('handler',)
+)
+telegram_requests = Counter(
+    'bot_telegram_requests_total', "Telegram Bot API calls by method and HTTP status.", ('method', 'status')
+)
+telegram_duration = Histogram(
+    'bot_telegram_request_duration_seconds', "Time per Telegram Bot API call.", ('method',)
+)
+provisioning_in_flight = Gauge(
+    'bot_provisioning_in_flight', "Provisioning jobs currently running."
+)
+
+
+def timed(step: str):
+    """
+    Decorator recording a function's latency (and errors) under `step`, and
+    a tracing span of the same name when called within a trace.
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with tracing.span(step):
+                        return await func(*args, **kwargs)
+                except Exception:
+                    step_errors.inc(step=step)
+                    raise
+                finally:
+                    step_duration.observe(time.perf_counter() - start, step=step)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with tracing.span(step):
+                        return func(*args, **kwargs)
+                except Exception:
+                    step_errors.inc(step=step)
+                    raise
+                finally:
+                    step_duration.observe(time.perf_counter() - start, step=step)
+        return wrapper
+
+    return decorator
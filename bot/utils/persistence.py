@@ -0,0 +1,156 @@
+"""SQLite-backed persistence for conversation state and user_data."""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from telegram.ext import BasePersistence, PersistenceInput
+from bot.utils.encryption import encrypt, decrypt
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Persist conversation states and user_data in a SQLite file.
+
+    The application hands over changed entries every `update_interval`
+    seconds; they are buffered and written in a single transaction off the
+    event loop, one row per user or conversation, so nothing is rewritten
+    wholesale. user_data rows are encrypted since they hold passwords.
+    """
+
+    def __init__(self, path: str, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval
+        )
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, PRIMARY KEY (name, key))"
+            )
+        # Pending writes: user_id -> data (None = delete), (name, key) -> state (None = delete)
+        self._pending_users: dict[int, dict | None] = {}
+        self._pending_conversations: dict[tuple[str, str], object] = {}
+        self._write_task: asyncio.Task | None = None
+        self._write_lock = asyncio.Lock()
+
+    def _write(self, users: dict, conversations: dict) -> None:
+        with self._conn:
+            for user_id, data in users.items():
+                if data is None:
+                    self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                        (user_id, encrypt(json.dumps(data).encode()))
+                    )
+            for (name, key), state in conversations.items():
+                if state is None:
+                    self._conn.execute(
+                        "DELETE FROM conversations WHERE name = ? AND key = ?", (name, key)
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                        (name, key, json.dumps(state))
+                    )
+
+    async def _write_pending(self) -> None:
+        """Write everything buffered so far in one transaction."""
+        async with self._write_lock:
+            users, self._pending_users = self._pending_users, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if users or conversations:
+                await asyncio.to_thread(self._write, users, conversations)
+
+    def _schedule_write(self) -> None:
+        """Coalesce all updates handed over in one persistence run into one write."""
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_later())
+
+    async def _write_later(self) -> None:
+        await asyncio.sleep(0)
+        try:
+            await self._write_pending()
+        except Exception as e:
+            logger.error("Error writing persistence: %s", e, exc_info=True)
+
+    async def get_user_data(self) -> dict[int, dict]:
+        rows = await asyncio.to_thread(
+            lambda: self._conn.execute("SELECT user_id, data FROM user_data").fetchall()
+        )
+        user_data = {}
+        for user_id, data in rows:
+            try:
+                user_data[user_id] = json.loads(decrypt(data))
+            except Exception as e:
+                logger.warning("Discarding unreadable user_data for %s: %s", user_id, e)
+        logger.info("Restored user_data for %s user(s)", len(user_data))
+        return user_data
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await asyncio.to_thread(
+            lambda: self._conn.execute(
+                "SELECT key, state FROM conversations WHERE name = ?", (name,)
+            ).fetchall()
+        )
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object) -> None:
+        self._pending_conversations[(name, json.dumps(list(key)))] = new_state
+        self._schedule_write()
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._pending_users[user_id] = data
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending_users[user_id] = None
+        self._schedule_write()
+
+    async def flush(self) -> None:
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
+        await asyncio.to_thread(self._conn.close)
+
+    # Only user_data and conversations are stored
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
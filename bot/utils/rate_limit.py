@@ -0,0 +1,129 @@
+"""In-memory rate limiting and lockouts."""
+import logging
+import time
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+from bot.utils.config import (
+    RATE_LIMIT_USER_RATE,
+    RATE_LIMIT_USER_BURST,
+    RATE_LIMIT_GLOBAL_RATE,
+    RATE_LIMIT_GLOBAL_BURST,
+    BOT_PASSWORD_MAX_ATTEMPTS,
+    BOT_PASSWORD_LOCKOUT,
+    BOT_PASSWORD_FAILURE_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+# Per-key state is pruned once the table grows past this many entries
+MAX_TRACKED_KEYS = 10000
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def allow(self, now: float) -> bool:
+        """Take one token if available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """Per-key token buckets plus one global bucket."""
+
+    def __init__(self, rate: float, burst: float, global_rate: float, global_burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[int, TokenBucket] = {}
+        self._global = TokenBucket(global_rate, global_burst)
+
+    def allow(self, key: int) -> bool:
+        """Return True if the key may proceed now."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_KEYS:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket.allow(now) and self._global.allow(now)
+
+    def _prune(self, now: float) -> None:
+        """Forget buckets that have refilled completely; they behave like new ones."""
+        full_after = self.burst / self.rate
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket.updated < full_after
+        }
+
+
+class Lockout:
+    """Exponential lockout after repeated failures, forgotten after a quiet `window`."""
+
+    def __init__(self, max_attempts: int, base_delay: float, window: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.window = window
+        # key -> (consecutive failures, locked until on the monotonic clock)
+        self._failures: dict[int, tuple[int, float]] = {}
+
+    def remaining(self, key: int) -> float:
+        """Return the seconds left on the key's lockout (0 if not locked)."""
+        entry = self._failures.get(key)
+        if entry is None:
+            return 0
+        return max(0.0, entry[1] - time.monotonic())
+
+    def record_failure(self, key: int) -> float:
+        """Record a failure and return the lockout it triggered (0 if none)."""
+        now = time.monotonic()
+        if len(self._failures) >= MAX_TRACKED_KEYS:
+            self._failures = {k: v for k, v in self._failures.items() if v[1] > now}
+
+        count, locked_until = self._failures.get(key, (0, 0))
+        # Start over once the key has been quiet for a window past its last lockout
+        if now - locked_until > self.window:
+            count = 0
+        count += 1
+        delay = 0.0
+        if count >= self.max_attempts:
+            delay = self.base_delay * 2 ** (count - self.max_attempts)
+        self._failures[key] = (count, now + delay)
+        return delay
+
+    def reset(self, key: int) -> None:
+        """Forget a key's failures (after a success)."""
+        self._failures.pop(key, None)
+
+
+limiter = RateLimiter(
+    RATE_LIMIT_USER_RATE,
+    RATE_LIMIT_USER_BURST,
+    RATE_LIMIT_GLOBAL_RATE,
+    RATE_LIMIT_GLOBAL_BURST
+)
+bot_password_lockout = Lockout(BOT_PASSWORD_MAX_ATTEMPTS, BOT_PASSWORD_LOCKOUT, BOT_PASSWORD_FAILURE_WINDOW)
+
+
+async def enforce_rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Drop updates from users over their rate (or when the bot is over its
+    global rate) before any other handler runs.
+    """
+    user = update.effective_user
+    if user is None or limiter.allow(user.id):
+        return
+
+    logger.warning("Rate limited update from user %s", user.id)
+    raise ApplicationHandlerStop
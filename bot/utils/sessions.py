@@ -0,0 +1,115 @@
+"""Idle conversation tracking and eviction."""
+import asyncio
+import functools
+import logging
+import time
+from telegram import Update
+from telegram.ext import Application, ContextTypes, ConversationHandler
+from bot.utils import metrics, tracing
+from bot.utils.config import CONVERSATION_TIMEOUT, TOTP_CONFIRM_TIMEOUT, SESSION_SWEEP_INTERVAL
+from bot.handlers.auth import TOTP_CONFIRM
+
+logger = logging.getLogger(__name__)
+
+# Idle timeout per conversation state; CONVERSATION_TIMEOUT for any other state
+STATE_TIMEOUTS = {
+    TOTP_CONFIRM: TOTP_CONFIRM_TIMEOUT,
+}
+
+
+def tracked(callback, entry: bool = False):
+    """
+    Wrap a conversation callback to record the state the user is now in.
+
+    Non-entry callbacks end the conversation if the user's data was evicted
+    while they were idle. Every callback runs in a span of the registration's
+    trace, whose id is kept in user_data until the conversation ends.
+    """
+
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not entry and 'state' not in context.user_data:
+            await update.message.reply_text(
+                "⌛ Your registration session expired.\n\n"
+                "Use /start to begin again."
+            )
+            return ConversationHandler.END
+
+        trace_id = context.user_data.setdefault('trace_id', tracing.new_trace_id())
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"handler.{callback.__name__}", trace_id=trace_id,
+                              state=context.user_data.get('state', 'start')):
+                new_state = await callback(update, context)
+        except Exception:
+            metrics.handler_errors.inc(handler=callback.__name__)
+            raise
+        finally:
+            metrics.handler_duration.observe(time.perf_counter() - start, handler=callback.__name__)
+
+        if new_state == ConversationHandler.END:
+            context.user_data.pop('state', None)
+            context.user_data.pop('last_active', None)
+            tracing.end_trace(context.user_data.pop('trace_id', trace_id))
+            if not context.user_data:
+                context.application.drop_user_data(update.effective_user.id)
+        elif new_state is not None:
+            context.user_data['state'] = new_state
+            context.user_data['last_active'] = time.time()
+        else:
+            # Staying in the same state still counts as activity
+            context.user_data['last_active'] = time.time()
+        return new_state
+
+    return wrapper
+
+
+def live_conversations(application: Application) -> int:
+    """Return the number of users currently in a registration conversation."""
+    return sum(1 for data in application.user_data.values() if 'state' in data)
+
+
+def _end_conversations(application: Application, user_id: int) -> None:
+    """Forget the user's conversation state; persistent handlers drop it from storage on the next flush."""
+    # Registration runs in private chats, where the chat id is the user id
+    key = (user_id, user_id)
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                # There is no public API to end a conversation outside its callbacks
+                handler._conversations.pop(key, None)
+
+
+def sweep(application: Application) -> int:
+    """Evict idle conversations and their user_data. Returns the number evicted."""
+    now = time.time()
+    expired = []
+    for user_id, data in application.user_data.items():
+        # Keep users whose account is still being created in the background;
+        # the job always settles, as validate_config keeps jobs as durable as user_data
+        if data.get('provisioning') == 'pending':
+            continue
+        timeout = STATE_TIMEOUTS.get(data.get('state'), CONVERSATION_TIMEOUT)
+        if now - data.get('last_active', 0) > timeout:
+            expired.append(user_id)
+
+    for user_id in expired:
+        application.drop_user_data(user_id)
+        _end_conversations(application, user_id)
+        if user_id in application.chat_data:
+            application.drop_chat_data(user_id)
+    return len(expired)
+
+
+async def sweep_periodically(application: Application) -> None:
+    """Evict idle conversations every SESSION_SWEEP_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            evicted = sweep(application)
+            logger.info(
+                "Session sweep: evicted %s, %s live conversation(s)",
+                evicted, live_conversations(application)
+            )
+        except Exception as e:
+            logger.error("Error sweeping idle sessions: %s", e, exc_info=True)
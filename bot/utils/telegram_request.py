@@ -0,0 +1,23 @@
+"""Telegram Bot API transport that records call counts and latency."""
+import time
+from telegram.error import NetworkError
+from telegram.request import HTTPXRequest
+from bot.utils import metrics, tracing
+
+
+class MeteredRequest(HTTPXRequest):
+    """HTTPXRequest that counts every Bot API call by method and status."""
+
+    async def do_request(self, url: str, method: str, request_data=None, **kwargs) -> tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"telegram.{api_method}"):
+                code, payload = await super().do_request(url, method, request_data, **kwargs)
+        except NetworkError:
+            metrics.telegram_requests.inc(method=api_method, status='error')
+            raise
+        finally:
+            metrics.telegram_duration.observe(time.perf_counter() - start, method=api_method)
+        metrics.telegram_requests.inc(method=api_method, status=code)
+        return code, payload
@@ -0,0 +1,258 @@
+"""
+Tracing for registrations.
+
+Each registration is one trace: the conversation handlers, the provisioning
+job, every signup step and every upstream call record spans into it. The
+current span lives in a ContextVar, so it follows asyncio tasks; between
+updates the trace id is kept in user_data, and in the provisioning job.
+The trace id is sent to Authentik and Cloudflare as a W3C `traceparent`
+header.
+
+Finished spans are batched to a pluggable exporter (JSON lines or OTLP/HTTP)
+off the hot path, and a signup slower than SLOW_SIGNUP_THRESHOLD logs its
+whole span tree.
+"""
+import asyncio
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import secrets
+import time
+from dataclasses import dataclass, field, asdict
+import httpx
+from bot.utils.config import (
+    TRACE_EXPORTER,
+    TRACE_FILE,
+    OTLP_ENDPOINT,
+    TRACE_EXPORT_INTERVAL,
+    SLOW_SIGNUP_THRESHOLD,
+    SLOW_SIGNUP_SAMPLE_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Finished spans kept per trace for the slow-signup log, and how many traces
+MAX_SPANS_PER_TRACE = 200
+MAX_BUFFERED_TRACES = 1000
+# Finished spans waiting for the exporter; the oldest are dropped beyond this
+MAX_PENDING_SPANS = 10000
+
+
+@dataclass
+class Span:
+    """One timed operation within a trace."""
+    name: str
+    trace_id: str
+    parent_id: str | None = None
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    start: float = field(default_factory=time.time)
+    duration: float = 0.0
+    status: str = 'ok'
+    attributes: dict = field(default_factory=dict)
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar('current_span', default=None)
+
+# trace id -> finished spans, least recently used first
+_traces: collections.OrderedDict[str, list[Span]] = collections.OrderedDict()
+_pending: collections.deque[Span] = collections.deque(maxlen=MAX_PENDING_SPANS)
+
+
+def new_trace_id() -> str:
+    """Return a new random trace id."""
+    return secrets.token_hex(16)
+
+
+def current_span() -> Span | None:
+    """Return the span the caller is running in, if any."""
+    return _current.get()
+
+
+def headers() -> dict[str, str]:
+    """Return the W3C trace context headers for an outbound request."""
+    current = _current.get()
+    if current is None:
+        return {}
+    return {'traceparent': f"00-{current.trace_id}-{current.span_id}-01"}
+
+
+async def inject_headers(request: httpx.Request) -> None:
+    """httpx request hook adding the trace context headers."""
+    request.headers.update(headers())
+
+
+def _record(finished: Span) -> None:
+    spans = _traces.get(finished.trace_id)
+    if spans is None:
+        spans = _traces[finished.trace_id] = []
+        if len(_traces) > MAX_BUFFERED_TRACES:
+            _traces.popitem(last=False)
+    else:
+        _traces.move_to_end(finished.trace_id)
+    if len(spans) < MAX_SPANS_PER_TRACE:
+        spans.append(finished)
+    if _exporter is not None:
+        _pending.append(finished)
+
+
+@contextlib.contextmanager
+def span(name: str, trace_id: str | None = None, **attributes):
+    """
+    Record a span around a block.
+
+    The span is a child of the current span, or a root span of `trace_id`
+    when that names another trace. Outside any trace this does nothing.
+    """
+    parent = _current.get()
+    if trace_id is None:
+        if parent is None:
+            yield None
+            return
+        trace_id = parent.trace_id
+
+    new = Span(
+        name,
+        trace_id,
+        parent_id=parent.span_id if parent is not None and parent.trace_id == trace_id else None,
+        attributes=attributes
+    )
+    token = _current.set(new)
+    started = time.perf_counter()
+    try:
+        yield new
+    except Exception as e:
+        new.status = 'error'
+        new.attributes['error'] = type(e).__name__
+        raise
+    finally:
+        new.duration = time.perf_counter() - started
+        _current.reset(token)
+        _record(new)
+
+
+def end_trace(trace_id: str) -> None:
+    """Forget the buffered spans of a finished trace."""
+    _traces.pop(trace_id, None)
+
+
+def format_tree(trace_id: str) -> str:
+    """Render the buffered spans of a trace as an indented tree."""
+    spans = sorted(_traces.get(trace_id, []), key=lambda s: s.start)
+    ids = {s.span_id for s in spans}
+    children = collections.defaultdict(list)
+    for s in spans:
+        children[s.parent_id if s.parent_id in ids else None].append(s)
+
+    lines = []
+
+    def walk(parent_id: str | None, depth: int) -> None:
+        for s in children[parent_id]:
+            status = '' if s.status == 'ok' else f" [{s.attributes.get('error', s.status)}]"
+            lines.append(f"{'  ' * depth}{s.name} {s.duration * 1000:.1f}ms{status}")
+            walk(s.span_id, depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def log_if_slow(root: Span) -> None:
+    """Log the whole span tree of a sampled signup slower than SLOW_SIGNUP_THRESHOLD."""
+    if root.duration < SLOW_SIGNUP_THRESHOLD or random.random() >= SLOW_SIGNUP_SAMPLE_RATE:
+        return
+    logger.warning(
+        "Slow signup: %s took %.2fs (trace %s)\n%s",
+        root.name, root.duration, root.trace_id, format_tree(root.trace_id)
+    )
+
+
+class JsonLinesExporter:
+    """Append finished spans to a local file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, spans: list[Span]) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for s in spans:
+                f.write(json.dumps(asdict(s)) + "\n")
+
+    async def export(self, spans: list[Span]) -> None:
+        await asyncio.to_thread(self._write, spans)
+
+    async def close(self) -> None:
+        pass
+
+
+class OTLPExporter:
+    """Send finished spans to an OpenTelemetry collector over OTLP/HTTP with JSON encoding."""
+
+    def __init__(self, endpoint: str):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self._client = httpx.AsyncClient(timeout=10)
+
+    @staticmethod
+    def _encode(s: Span) -> dict:
+        start = int(s.start * 1e9)
+        return {
+            'traceId': s.trace_id,
+            'spanId': s.span_id,
+            'parentSpanId': s.parent_id or '',
+            'name': s.name,
+            'kind': 1,
+            'startTimeUnixNano': str(start),
+            'endTimeUnixNano': str(start + int(s.duration * 1e9)),
+            'attributes': [
+                {'key': key, 'value': {'stringValue': str(value)}} for key, value in s.attributes.items()
+            ],
+            'status': {'code': 2 if s.status == 'error' else 1},
+        }
+
+    async def export(self, spans: list[Span]) -> None:
+        body = {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': 'registration-bot'}},
+            ]},
+            'scopeSpans': [{'scope': {'name': 'bot'}, 'spans': [self._encode(s) for s in spans]}],
+        }]}
+        response = await self._client.post(self.url, json=body)
+        response.raise_for_status()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+EXPORTERS = {
+    'jsonl': lambda: JsonLinesExporter(TRACE_FILE),
+    'otlp': lambda: OTLPExporter(OTLP_ENDPOINT),
+}
+
+_exporter = EXPORTERS[TRACE_EXPORTER]() if TRACE_EXPORTER in EXPORTERS else None
+
+
+async def flush() -> None:
+    """Hand all pending spans to the exporter."""
+    if _exporter is None or not _pending:
+        return
+    spans = list(_pending)
+    _pending.clear()
+    try:
+        await _exporter.export(spans)
+    except Exception as e:
+        logger.warning("Exporting %s span(s) failed: %s", len(spans), e)
+
+
+async def export_periodically() -> None:
+    """Export finished spans every TRACE_EXPORT_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(TRACE_EXPORT_INTERVAL)
+        await flush()
+
+
+async def shutdown() -> None:
+    """Export what is left and close the exporter (called on shutdown)."""
+    await flush()
+    if _exporter is not None:
+        await _exporter.close()
@@ -0,0 +1,53 @@
+"""Concurrent update processing that keeps each chat's updates in order."""
+import asyncio
+import sys
+from typing import Any, Awaitable
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates from different chats in parallel, one at a time per chat.
+
+    The ConversationHandler relies on a chat's messages being handled in
+    order, so updates for the same chat wait on a per-chat lock (FIFO) while
+    independent chats progress concurrently. The concurrency limit is applied
+    only once a chat's turn comes, so a busy chat cannot tie up slots that
+    other chats could use.
+    """
+
+    __slots__ = ("_limit", "_chat_locks", "_chat_waiters")
+
+    def __init__(self, max_concurrent_updates: int):
+        # The base class semaphore would be held while waiting on a chat lock;
+        # leave it effectively unbounded and enforce the limit ourselves.
+        super().__init__(sys.maxsize)
+        self._limit = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_waiters: dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._limit:
+                await coroutine
+            return
+
+        lock = self._chat_locks.setdefault(chat.id, asyncio.Lock())
+        self._chat_waiters[chat.id] = self._chat_waiters.get(chat.id, 0) + 1
+        try:
+            async with lock, self._limit:
+                await coroutine
+        finally:
+            # Drop the lock once nobody in this chat is waiting, to bound memory
+            self._chat_waiters[chat.id] -= 1
+            if not self._chat_waiters[chat.id]:
+                del self._chat_waiters[chat.id]
+                del self._chat_locks[chat.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
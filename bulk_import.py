@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Bulk registration from a CSV file.
+
+Usage:
+    python bulk_import.py users.csv [--output results.csv] [--concurrency N] [--dry-run]
+
+The CSV needs `email` and `username` columns and may have a `password`
+column; rows without a password get a random one. Every row is validated
+first, then checked against all existing Authentik users in one paged scan.
+Accounts are created with bounded concurrency, and all new emails are added
+to the Cloudflare Access policy in a single update. One result row per input
+row (including the initial passwords) is written to --output, or stdout.
+Rows that a previous, interrupted run started are resumed, not skipped.
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import secrets
+import sys
+import uuid
+
+from bot.utils.logging_setup import configure_logging
+
+# Configure logging before anything else logs
+configure_logging()
+logger = logging.getLogger(__name__)
+
+from bot.services import authentik_api, cloudflare_access, provisioning_state
+from bot.services.cloudflare_api import add_emails_to_access, CLOUDFLARE_ENABLED
+from bot.services.provisioning_state import GROUPED
+from bot.services.user_service import ensure_account
+from bot.utils.config import AUTHENTIK_URL, AUTHENTIK_API_TOKEN, AUTHENTIK_MAX_CONCURRENCY, JELLYFIN_GROUP
+from bot.utils.validators import validate_email, validate_username, validate_password
+
+RESULT_FIELDS = ['line', 'username', 'email', 'status', 'password', 'detail']
+
+
+def _generate_password() -> str:
+    """Return a random password that passes validate_password."""
+    while True:
+        password = secrets.token_urlsafe(12)
+        if validate_password(password)[0]:
+            return password
+
+
+def _result(row: dict, status: str, detail: str = '', password: str = '') -> dict:
+    return {
+        'line': row['line'],
+        'username': row['username'],
+        'email': row['email'],
+        'status': status,
+        'password': password,
+        'detail': detail,
+    }
+
+
+def read_rows(path: str) -> tuple[list[dict], list[dict]]:
+    """Validate every CSV row. Returns (valid rows, results for rejected rows)."""
+    valid, rejected = [], []
+    seen_emails, seen_usernames = set(), set()
+
+    with open(path, newline='', encoding='utf-8') as f:
+        for line, raw in enumerate(csv.DictReader(f), start=2):
+            row = {
+                'line': line,
+                'email': (raw.get('email') or '').strip(),
+                'username': (raw.get('username') or '').strip(),
+            }
+            email_ok, email = validate_email(row['email'])
+            username_ok, username = validate_username(row['username'])
+            password_ok, password = validate_password((raw.get('password') or '').strip() or _generate_password())
+
+            for ok, message in [(email_ok, email), (username_ok, username), (password_ok, password)]:
+                if not ok:
+                    rejected.append(_result(row, 'invalid', message))
+                    break
+            else:
+                if email in seen_emails or username.lower() in seen_usernames:
+                    rejected.append(_result(row, 'invalid', "Duplicate of an earlier row."))
+                    continue
+                seen_emails.add(email)
+                seen_usernames.add(username.lower())
+                valid.append({'line': line, 'email': email, 'username': username, 'password': password})
+
+    return valid, rejected
+
+
+async def _provision(row: dict, semaphore: asyncio.Semaphore, run_id: str) -> dict:
+    """Create one account and add it to the Jellyfin group."""
+    username, email = row['username'], row['email']
+    async with semaphore:
+        try:
+            state = await provisioning_state.get(username)
+            user_pk = await ensure_account(username, email, row['password'], state, job_id=run_id)
+        except Exception as e:
+            logger.error("Failed to create %s: %s", username, e)
+            return _result(row, 'failed', str(e))
+
+        if user_pk is None:
+            return _result(row, 'failed', "Username already taken.")
+
+        detail = ''
+        state = await provisioning_state.get(username)
+        if not state.get(GROUPED):
+            if await authentik_api.add_user_to_group(user_pk, JELLYFIN_GROUP):
+                await provisioning_state.record(username, **{GROUPED: True})
+            else:
+                detail = f"Not added to {JELLYFIN_GROUP}."
+
+    logger.info("Created %s", username)
+    return _result(row, 'created', detail, password=row['password'])
+
+
+async def bulk_import(rows: list[dict], concurrency: int, dry_run: bool = False) -> list[dict]:
+    """Dedupe rows against Authentik, create the new accounts and grant access."""
+    emails, usernames = await authentik_api.fetch_user_identities()
+
+    results, todo = [], []
+    for row in rows:
+        # An earlier run that stopped half-way left these accounts behind; resume them
+        if await provisioning_state.is_resumable(row['username'], row['email'], None):
+            todo.append(row)
+        elif row['email'] in emails:
+            results.append(_result(row, 'skipped', "Email already registered."))
+        elif row['username'].lower() in usernames:
+            results.append(_result(row, 'skipped', "Username already taken."))
+        else:
+            todo.append(row)
+    logger.info("%s new account(s) to create, %s already registered", len(todo), len(results))
+
+    if dry_run:
+        return results + [_result(row, 'pending') for row in todo]
+
+    # Each run has new passwords for the rows it resumes, so they are always set again
+    run_id = uuid.uuid4().hex
+    semaphore = asyncio.Semaphore(concurrency)
+    created = await asyncio.gather(*(_provision(row, semaphore, run_id) for row in todo))
+    results.extend(created)
+
+    new_rows = [result for result in created if result['status'] == 'created']
+    if CLOUDFLARE_ENABLED and new_rows:
+        if not await add_emails_to_access([result['email'] for result in new_rows]):
+            logger.error("Cloudflare Access update failed; add the created emails manually")
+            for result in new_rows:
+                result['detail'] = " ".join(filter(None, [result['detail'], "Not added to Cloudflare Access."]))
+
+    for result in new_rows:
+        await provisioning_state.clear(result['username'])
+
+    return results
+
+
+async def main(args: argparse.Namespace) -> int:
+    rows, results = read_rows(args.csv)
+    logger.info("Read %s row(s), %s invalid", len(rows) + len(results), len(results))
+
+    authentik_api.init_client()
+    if CLOUDFLARE_ENABLED:
+        cloudflare_access.init_client()
+    try:
+        results.extend(await bulk_import(rows, args.concurrency, args.dry_run))
+    finally:
+        await authentik_api.close_client()
+        if CLOUDFLARE_ENABLED:
+            await cloudflare_access.close_client()
+
+    results.sort(key=lambda result: result['line'])
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    failed = sum(result['status'] in ('invalid', 'failed') for result in results)
+    logger.info("Done: %s ok, %s invalid or failed", len(results) - failed, failed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Register users in bulk from a CSV file.")
+    parser.add_argument('csv', help="CSV file with email, username and optional password columns")
+    parser.add_argument('--output', help="write results here instead of stdout")
+    parser.add_argument('--concurrency', type=int, default=AUTHENTIK_MAX_CONCURRENCY,
+                        help="accounts created at the same time")
+    parser.add_argument('--dry-run', action='store_true', help="validate and dedupe only")
+    args = parser.parse_args()
+
+    if not all([AUTHENTIK_URL, AUTHENTIK_API_TOKEN]):
+        logger.error("Please set: AUTHENTIK_URL, AUTHENTIK_API_TOKEN")
+        sys.exit(1)
+
+    sys.exit(asyncio.run(main(args)))
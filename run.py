@@ -11,11 +11,10 @@ Or with bash:
 import logging
 import sys
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from bot.utils.logging_setup import configure_logging
+
+# Configure logging before anything else logs
+configure_logging()
 logger = logging.getLogger(__name__)
 
 try:
@@ -30,9 +29,9 @@ try:
             sys.exit(1)
 
 except ImportError as e:
-    logger.error(f"Failed to import required modules: {e}")
+    logger.error("Failed to import required modules: %s", e)
     logger.error("Make sure you're running this from the project root directory")
     sys.exit(1)
 except Exception as e:
-    logger.error(f"Fatal error: {e}", exc_info=True)
+    logger.error("Fatal error: %s", e, exc_info=True)
     sys.exit(1)
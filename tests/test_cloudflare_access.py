@@ -0,0 +1,63 @@
+"""Tests for batching Cloudflare Access include updates."""
+import asyncio
+from bot.services import cloudflare_access
+from bot.services.cloudflare_access import IncludeBatcher
+
+
+def test_concurrent_adds_share_one_update(monkeypatch):
+    monkeypatch.setattr(cloudflare_access, 'CF_BATCH_WINDOW', 0.01)
+    calls = []
+
+    async def add_emails(path, kind, emails):
+        calls.append(sorted(emails))
+        return True
+
+    monkeypatch.setattr(cloudflare_access, '_add_emails_to_include', add_emails)
+
+    async def scenario():
+        batcher = IncludeBatcher('policies/1', 'policy')
+        return await asyncio.gather(
+            batcher.add('a@example.com'),
+            batcher.add('b@example.com'),
+            batcher.add('c@example.com'),
+        )
+
+    assert asyncio.run(scenario()) == [True, True, True]
+    assert calls == [['a@example.com', 'b@example.com', 'c@example.com']]
+
+
+def test_email_added_during_flush_goes_into_next_batch(monkeypatch):
+    monkeypatch.setattr(cloudflare_access, 'CF_BATCH_WINDOW', 0.01)
+    calls = []
+    running = 0
+    overlapped = False
+
+    async def scenario():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def add_emails(path, kind, emails):
+            nonlocal running, overlapped
+            running += 1
+            overlapped = overlapped or running > 1
+            calls.append(sorted(emails))
+            started.set()
+            await release.wait()
+            running -= 1
+            # The first batch fails, the second succeeds
+            return len(calls) > 1
+
+        monkeypatch.setattr(cloudflare_access, '_add_emails_to_include', add_emails)
+        batcher = IncludeBatcher('policies/1', 'policy')
+
+        first = asyncio.create_task(batcher.add('a@example.com'))
+        await started.wait()
+        second = asyncio.create_task(batcher.add('b@example.com'))
+        # Longer than the batch window, so the next flush is waiting on the lock
+        await asyncio.sleep(0.05)
+        release.set()
+        return await first, await second
+
+    assert asyncio.run(scenario()) == (False, True)
+    assert calls == [['a@example.com'], ['b@example.com']]
+    assert not overlapped
@@ -0,0 +1,39 @@
+"""Tests for the command handlers."""
+import asyncio
+import types
+from telegram.ext import ConversationHandler
+from bot.handlers.auth import TOTP_CONFIRM
+from bot.handlers.commands import cancel
+
+
+class _Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def _cancel(user_data: dict):
+    update = types.SimpleNamespace(message=_Message())
+    context = types.SimpleNamespace(user_data=user_data)
+    return asyncio.run(cancel(update, context)), update.message.replies
+
+
+def test_cancel_ends_registration():
+    user_data = {'email': 'alice@example.com'}
+
+    state, replies = _cancel(user_data)
+
+    assert state == ConversationHandler.END
+    assert user_data == {}
+
+
+def test_cancel_refused_while_account_is_created():
+    user_data = {'provisioning': 'pending', 'password': 'secret'}
+
+    state, replies = _cancel(user_data)
+
+    assert state == TOTP_CONFIRM
+    assert user_data['provisioning'] == 'pending'
+    assert "can't be cancelled" in replies[0]
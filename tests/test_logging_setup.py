@@ -0,0 +1,20 @@
+"""Tests for log redaction and capping."""
+import logging
+import queue
+from bot.utils import logging_setup
+
+
+def test_redact_masks_secrets_in_any_case():
+    assert logging_setup.redact("PASSWORD=hunter2") == "PASSWORD=[REDACTED]"
+    assert logging_setup.redact("signup for alice@example.com") == "signup for a***@example.com"
+
+
+def test_queue_handler_caps_message(monkeypatch):
+    monkeypatch.setattr(logging_setup, 'LOG_MAX_MESSAGE', 10)
+    handler = logging_setup._QueueHandler(queue.SimpleQueue())
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, "%s", ('x' * 100,), None)
+
+    prepared = handler.prepare(record)
+
+    assert prepared.msg == "xxxxxxxxxx... [90 chars truncated]"
+    assert prepared.args is None
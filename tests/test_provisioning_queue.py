@@ -0,0 +1,31 @@
+"""Tests for the background provisioning queue."""
+import asyncio
+from bot.services.provisioning_queue import MemoryJobStore, ProvisioningJob, ProvisioningQueue
+
+
+def _job(username: str) -> ProvisioningJob:
+    return ProvisioningJob(chat_id=1, user_id=1, email=f"{username}@example.com", username=username, password='x')
+
+
+def test_worker_survives_failing_on_failure(monkeypatch):
+    monkeypatch.setattr('bot.services.provisioning_queue.PROVISION_MAX_ATTEMPTS', 1)
+    done = []
+
+    async def handler(job):
+        if job.username == 'broken':
+            raise RuntimeError("upstream down")
+        done.append(job.username)
+
+    async def on_failure(job, error):
+        raise RuntimeError("user blocked the bot")
+
+    async def scenario():
+        queue = ProvisioningQueue(MemoryJobStore(), handler, on_failure, workers=1)
+        await queue.start()
+        await queue.enqueue(_job('broken'))
+        await queue.enqueue(_job('alice'))
+        await asyncio.wait_for(queue._queue.join(), timeout=1)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert done == ['alice']
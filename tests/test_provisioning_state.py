@@ -0,0 +1,19 @@
+"""Tests for per-username provisioning progress."""
+import asyncio
+from bot.services import provisioning_state
+
+
+def test_is_resumable_matches_owner_username_and_email(monkeypatch):
+    monkeypatch.setattr(provisioning_state, '_store', provisioning_state.MemoryStateStore())
+
+    async def scenario():
+        await provisioning_state.record('Alice', email='alice@example.com', owner=42, created=7)
+        return (
+            await provisioning_state.is_resumable('alice', 'Alice@Example.com', 42),
+            await provisioning_state.is_resumable('alice', 'alice@example.com', 666),
+            await provisioning_state.is_resumable('alice', 'alice@example.com', None),
+            await provisioning_state.is_resumable('alice', 'mallory@example.com', 42),
+            await provisioning_state.is_resumable('bob', 'alice@example.com', 42),
+        )
+
+    assert asyncio.run(scenario()) == (True, False, False, False, False)
@@ -0,0 +1,23 @@
+"""Tests for the bot password lockout."""
+from bot.utils import rate_limit
+from bot.utils.rate_limit import Lockout
+
+
+def test_lockout_doubles_after_max_attempts():
+    lockout = Lockout(max_attempts=2, base_delay=10, window=3600)
+
+    assert lockout.record_failure(1) == 0
+    assert lockout.record_failure(1) == 10
+    assert lockout.record_failure(1) == 20
+    assert lockout.remaining(1) > 0
+
+
+def test_lockout_forgets_failures_after_quiet_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'monotonic', lambda: now[0])
+    lockout = Lockout(max_attempts=2, base_delay=10, window=60)
+
+    lockout.record_failure(1)
+    now[0] += 61
+
+    assert lockout.record_failure(1) == 0
@@ -0,0 +1,52 @@
+"""Tests for the circuit breaker and retry layer."""
+import asyncio
+import pytest
+from bot.services.resilience import CircuitBreaker, CircuitOpenError, call
+
+
+def _transient(error: Exception) -> bool:
+    return isinstance(error, ConnectionError)
+
+
+async def _fail():
+    raise ConnectionError("upstream down")
+
+
+async def _ok():
+    return 'ok'
+
+
+async def _hang():
+    await asyncio.sleep(60)
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await call(breaker, _fail, is_transient=_transient)
+        with pytest.raises(CircuitOpenError):
+            await call(breaker, _ok)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_trial_does_not_wedge_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await call(breaker, _fail, is_transient=_transient)
+        assert breaker.is_open
+
+        # The half-open trial is cancelled by an outer timeout
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(call(breaker, _hang), timeout=0.01)
+
+        # The next call becomes the trial again and closes the circuit
+        assert await call(breaker, _ok) == 'ok'
+        assert not breaker.is_open
+
+    asyncio.run(scenario())
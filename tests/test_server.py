@@ -0,0 +1,52 @@
+"""Tests for the webhook endpoint."""
+import asyncio
+import types
+import httpx
+from bot import server
+
+UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1,
+        'date': 0,
+        'chat': {'id': 42, 'type': 'private'},
+        'from': {'id': 42, 'is_bot': False, 'first_name': 'Alice'},
+        'text': '/start',
+    },
+}
+
+
+async def _post(application, secret: str) -> httpx.Response:
+    transport = httpx.ASGITransport(app=server.create_asgi_app(application))
+    async with httpx.AsyncClient(transport=transport, base_url='http://bot') as client:
+        return await client.post(
+            server.WEBHOOK_PATH,
+            json=UPDATE,
+            headers={'X-Telegram-Bot-Api-Secret-Token': secret}
+        )
+
+
+def _application():
+    return types.SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+
+
+def test_webhook_rejects_wrong_secret(monkeypatch):
+    monkeypatch.setattr(server, 'WEBHOOK_SECRET', 'right')
+    application = _application()
+
+    response = asyncio.run(_post(application, 'wrong'))
+
+    assert response.status_code == 403
+    assert application.update_queue.empty()
+
+
+def test_webhook_enqueues_update(monkeypatch):
+    monkeypatch.setattr(server, 'WEBHOOK_SECRET', 'right')
+    application = _application()
+
+    response = asyncio.run(_post(application, 'right'))
+
+    assert response.status_code == 200
+    update = application.update_queue.get_nowait()
+    assert update.update_id == 1
+    assert update.message.text == '/start'
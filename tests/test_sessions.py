@@ -0,0 +1,37 @@
+"""Tests for idle conversation eviction."""
+from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler
+from bot.handlers.auth import EMAIL
+from bot.utils import sessions
+
+
+async def _noop(update, context):
+    return None
+
+
+def _application():
+    application = ApplicationBuilder().token('123:test').build()
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('start', _noop)],
+        states={EMAIL: [CommandHandler('start', _noop)]},
+        fallbacks=[],
+    ))
+    return application
+
+
+def test_sweep_ends_idle_conversations():
+    application = _application()
+    conversation = application.handlers[0][0]
+    application.user_data[42].update(state=EMAIL, last_active=0)
+    conversation._conversations[(42, 42)] = EMAIL
+
+    assert sessions.sweep(application) == 1
+    assert 42 not in application.user_data
+    assert (42, 42) not in conversation._conversations
+
+
+def test_sweep_keeps_pending_signups():
+    application = _application()
+    application.user_data[42].update(state=EMAIL, last_active=0, provisioning='pending')
+
+    assert sessions.sweep(application) == 0
+    assert 42 in application.user_data
@@ -0,0 +1,48 @@
+"""Tests for per-chat ordered update processing."""
+import asyncio
+from telegram import Update
+from bot.utils.update_processor import PerChatUpdateProcessor
+
+
+def _update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': str(update_id),
+        },
+    }, None)
+
+
+def test_orders_each_chat_and_runs_chats_in_parallel():
+    events = []
+    running = set()
+    overlapped = False
+
+    async def handle(chat_id: int, n: int) -> None:
+        nonlocal overlapped
+        running.add(chat_id)
+        overlapped = overlapped or len(running) > 1
+        # Later updates finish sooner, so only the lock keeps them in order
+        await asyncio.sleep(0.01 * (4 - n))
+        running.discard(chat_id)
+        events.append((chat_id, n))
+
+    async def scenario():
+        processor = PerChatUpdateProcessor(8)
+        await asyncio.gather(*(
+            processor.process_update(_update(n * 10 + chat_id, chat_id), handle(chat_id, n))
+            for n in range(4)
+            for chat_id in (1, 2)
+        ))
+        return processor
+
+    processor = asyncio.run(scenario())
+
+    for chat_id in (1, 2):
+        assert [n for chat, n in events if chat == chat_id] == [0, 1, 2, 3]
+    assert overlapped
+    assert processor._chat_locks == {}
+    assert processor._chat_waiters == {}
@@ -0,0 +1,34 @@
+"""Tests for resuming account provisioning."""
+import asyncio
+from bot.services import provisioning_state, user_service
+from bot.services.provisioning_state import CREATED, PASSWORD_SET
+
+
+def _resume(monkeypatch, job_id: str) -> list:
+    monkeypatch.setattr(provisioning_state, '_store', provisioning_state.MemoryStateStore())
+    passwords = []
+
+    async def set_user_password(user_pk, password):
+        passwords.append((user_pk, password))
+        return True
+
+    monkeypatch.setattr(user_service, 'set_user_password', set_user_password)
+
+    async def scenario():
+        state = await provisioning_state.record(
+            'alice', email='alice@example.com', owner=42, **{CREATED: 7, PASSWORD_SET: 'job-1'}
+        )
+        return await user_service.ensure_account(
+            'alice', 'alice@example.com', 'new-password', state, owner=42, job_id=job_id
+        )
+
+    assert asyncio.run(scenario()) == 7
+    return passwords
+
+
+def test_retry_of_same_job_keeps_password(monkeypatch):
+    assert _resume(monkeypatch, 'job-1') == []
+
+
+def test_new_job_sets_its_password(monkeypatch):
+    assert _resume(monkeypatch, 'job-2') == [(7, 'new-password')]